@@ -0,0 +1,157 @@
+from .threads import StoppableThread
+import numpy as np
+import threading
+import time
+
+
+class FrameBuffer:
+    """
+    Small ring of preallocated frames shared between the camera and its readers.
+
+    The acquisition thread copies each frame into the slot after the newest
+    one and only then publishes it, so readers never see a half written
+    frame and never block the camera. A slot is reused after `slots` frames,
+    readers should finish with (or copy) a frame well within that time.
+    """
+
+    def __init__(self, slots=4) -> None:
+        self.slots = slots
+        self.frames = []
+        self.timestamps = np.zeros(slots)
+        self.seq = 0
+        self.condition = threading.Condition()
+
+    @property
+    def shape(self):
+        return self.frames[0].shape if self.frames else None
+
+    def publish(self, frame, timestamp):
+        if not self.frames or self.frames[0].shape != frame.shape or self.frames[0].dtype != frame.dtype:
+            with self.condition:
+                self.frames = [np.empty_like(frame) for _ in range(self.slots)]
+        slot = (self.seq + 1) % self.slots
+        np.copyto(self.frames[slot], frame)
+        self.timestamps[slot] = timestamp
+        with self.condition:
+            self.seq += 1
+            self.condition.notify_all()
+
+    def latest(self):
+        """
+        returns (seq, timestamp, frame) of the newest frame, or None before the first frame
+        """
+        with self.condition:
+            if self.seq == 0:
+                return None
+            slot = self.seq % self.slots
+            return self.seq, self.timestamps[slot], self.frames[slot]
+
+    def wait(self, seq, timeout=None):
+        """
+        block until a frame newer than seq is published, then return the newest one
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.seq > seq, timeout):
+                return None
+        return self.latest()
+
+
+class AcquisitionThread(StoppableThread):
+    """
+    Pulls frames from the camera at a fixed rate and publishes them to a FrameBuffer.
+
+    listeners are called with (frame, timestamp) for every frame on this
+    thread, so they must only hand the frame off and return.
+
+    The timestamp is the camera's own capture time where it has one. Frame
+    ids from the camera are checked for gaps and repeats (duplicated frames,
+    which are not published again). When rate is below the camera's
+    frame_rate the camera's newest-only buffer skips frames by design, gaps
+    up to that many frames are counted as skipped, the rest as dropped.
+
+    Each frame is captured and handed out while holding `lock`, so holding it
+    pauses acquisition, e.g. while the camera and the masks change together.
+    """
+
+    def __init__(self, camera, buffer, rate=30):
+        super().__init__()
+        self.daemon = True
+        self.camera = camera
+        self.buffer = buffer
+        self.rate = rate
+        self.frames = 0
+        self.dropped = 0
+        self.skipped = 0
+        self.duplicated = 0
+        self.errors = 0
+        self.last_id = None
+        self.listeners = []
+        self.lock = threading.Lock()
+
+    def _check_id(self, frame_id):
+        """
+        count frames missing before frame_id, returns False for a frame seen already
+        """
+        last_id, self.last_id = self.last_id, frame_id
+        if frame_id is None or last_id is None:
+            return True
+        if frame_id == last_id:
+            self.duplicated += 1
+            return False
+        # ids start again when acquisition restarts
+        if frame_id > last_id:
+            missing = frame_id - last_id - 1
+            skipped = min(missing, self._paced_skips())
+            self.skipped += skipped
+            self.dropped += missing - skipped
+        return True
+
+    def _paced_skips(self):
+        """
+        frames the camera takes between two of ours when pacing below its rate
+        """
+        frame_rate = self.camera.frame_rate
+        if not self.rate or not frame_rate:
+            return 0
+        return max(round(frame_rate / self.rate) - 1, 0)
+
+    def counters(self):
+        return {
+            "frames": self.frames,
+            "dropped": self.dropped,
+            "skipped": self.skipped,
+            "incomplete": self.camera.incomplete,
+            "duplicated": self.duplicated,
+            "errors": self.errors,
+        }
+
+    def run(self):
+        next_frame = time.perf_counter()
+        while not self.stopped():
+            with self.lock:
+                try:
+                    frame = self.camera.capture_data()
+                except Exception as e:
+                    print(e)
+                    self.errors += 1
+                    frame = None
+                if frame is not None and self._check_id(self.camera.frame_id):
+                    timestamp = self.camera.timestamp or time.time()
+                    self.buffer.publish(frame, timestamp)
+                    for listener in list(self.listeners):
+                        # a failing listener mustn't stop the camera for everyone else
+                        try:
+                            listener(frame, timestamp)
+                        except Exception as e:
+                            print(e)
+                            self.errors += 1
+                    self.frames += 1
+
+            if self.rate:
+                next_frame += 1 / self.rate
+                delay = next_frame - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    # running late, don't try to catch up with a burst of frames
+                    next_frame = time.perf_counter()
@@ -4,8 +4,9 @@ from datetime import datetime, timedelta
 
 
 class readThread(StoppableThread):
-    def __init__(self, arduino, lock, output, output_file_name):
+    def __init__(self, arduino, lock, output, output_file_name, writer=None):
         super().__init__()
+        self.writer = writer
         self.arduino = arduino
         self.lock = lock
         self.output = output
@@ -21,7 +22,7 @@ class readThread(StoppableThread):
                 try:
                     splitdata = data.split(",")
                     self.arduino.pressure = splitdata[0]
-                    self.arduino.dosingStatus = splitdata[1]
+                    self.arduino.set_dosing_status(splitdata[1])
                     y1 = float(self.arduino.pressure)
                     # plot time against pressure
                     now = datetime.now()
@@ -29,13 +30,17 @@ class readThread(StoppableThread):
                         self.last_second = now
                         smooth = sum(self.smoothing_list)
                         smooth = smooth/len(self.smoothing_list)
-                        self.output.push([now], [[smooth]])
+                        if self.output is not None:
+                            self.output.push([now], [[smooth]])
                         self.smoothing_list = []
                     else:
                         self.smoothing_list.append(y1)
                     # save values to file
-                    with open(self.output_file_name, "a") as file:
-                        file.write(f"{now}, {y1} \n")
+                    if self.writer is not None:
+                        self.writer.write(self.output_file_name, f"{now}, {y1} ")
+                    else:
+                        with open(self.output_file_name, "a") as file:
+                            file.write(f"{now}, {y1} \n")
                 except Exception as e:
                     print(f"partial message, {e}")
                     print(data)
@@ -47,6 +52,15 @@ class Arduino:
         self.ser.port = "COM6"
         self.pressure = 0
         self.dosingStatus = 0
+        self.status_listeners = []
+
+    def set_dosing_status(self, status):
+        # tell the listeners (the dose scheduler) straight away when dosing starts or stops
+        changed = status != self.dosingStatus
+        self.dosingStatus = status
+        if changed:
+            for listener in list(self.status_listeners):
+                listener(status)
 
     def open(self):
         self.ser.open()
@@ -0,0 +1,243 @@
+import serial_asyncio
+import asyncio
+import threading
+import re
+from datetime import datetime, timedelta
+
+
+class LineFramer:
+    """
+    Splits a byte stream into complete lines.
+
+    Bytes after the last terminator are kept until the rest of the line
+    arrives, so a message split over two reads comes out whole.
+    """
+
+    def __init__(self):
+        self.buffer = b""
+
+    def feed(self, data: bytes):
+        """
+        returns the lines completed by data, empty lines are skipped
+        """
+        parts = re.split(rb"\r\n|\r|\n", self.buffer + data)
+        self.buffer = parts.pop()
+        return [line for line in (part.decode(errors="replace").strip() for part in parts) if line]
+
+
+class SerialLineProtocol(asyncio.Protocol):
+    """
+    asyncio serial protocol that hands every complete line to on_line
+    """
+
+    def __init__(self, on_line):
+        self.on_line = on_line
+        self.framer = LineFramer()
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        for line in self.framer.feed(data):
+            self.on_line(line)
+
+    def connection_lost(self, exc):
+        self.transport = None
+
+
+class SerialLoop:
+    """
+    One asyncio event loop on a background thread that owns all serial devices.
+
+    Synchronous code (the UI, DataController) talks to it through call(),
+    which runs a coroutine on the loop and waits for its result.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def call(self, coroutine, timeout=None):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    def call_soon(self, callback, *args):
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+class AsyncSerialDevice:
+    """
+    Line based serial device on a SerialLoop
+    """
+
+    def __init__(self, serial_loop, port, baudrate=9600):
+        self.serial_loop = serial_loop
+        self.port = port
+        self.baudrate = baudrate
+        self.protocol = None
+
+    async def _open(self):
+        _, self.protocol = await serial_asyncio.create_serial_connection(
+            self.serial_loop.loop,
+            lambda: SerialLineProtocol(self.on_line),
+            self.port,
+            baudrate=self.baudrate,
+        )
+
+    async def _close(self):
+        if self.protocol is not None and self.protocol.transport is not None:
+            self.protocol.transport.close()
+        self.protocol = None
+
+    def open(self):
+        self.serial_loop.call(self._open())
+
+    def close(self):
+        self.serial_loop.call(self._close())
+
+    def write(self, byte: bytes):
+        self.serial_loop.call_soon(self.protocol.transport.write, byte)
+
+    def on_line(self, line):
+        pass
+
+
+class AsyncArduino(AsyncSerialDevice):
+    """
+    Arduino pressure and dosing stream, every line is "pressure,dosingStatus".
+
+    Parsed lines update pressure and dosingStatus like readThread does, and
+    are passed to every listener as (time, pressure, dosingStatus) on the
+    event loop, so listeners must not block.
+    """
+
+    def __init__(self, serial_loop, port="COM6", baudrate=9600):
+        super().__init__(serial_loop, port, baudrate)
+        self.pressure = 0
+        self.dosingStatus = 0
+        self.listeners = []
+        self.status_listeners = []
+
+    def on_line(self, line):
+        try:
+            pressure, status = line.split(",")[:2]
+            value = float(pressure)
+        except ValueError:
+            print(f"malformed message, {line}")
+            return
+        self.pressure = pressure
+        status = status.strip()
+        changed = status != self.dosingStatus
+        self.dosingStatus = status
+        if changed:
+            for listener in list(self.status_listeners):
+                listener(status)
+        now = datetime.now()
+        for listener in list(self.listeners):
+            listener(now, value, self.dosingStatus)
+
+
+class PressureLog:
+    """
+    AsyncArduino listener doing what readThread does: push a one second
+    average to the plot and log every reading through the LogWriter
+    """
+
+    def __init__(self, output, output_file_name, writer):
+        self.output = output
+        self.output_file_name = output_file_name
+        self.writer = writer
+        self.last_second = datetime.now()
+        self.smoothing_list = []
+
+    def __call__(self, now, pressure, status):
+        if now - self.last_second > timedelta(seconds=1) and self.smoothing_list:
+            self.last_second = now
+            if self.output is not None:
+                self.output.push([now], [[sum(self.smoothing_list) / len(self.smoothing_list)]])
+            self.smoothing_list = []
+        else:
+            self.smoothing_list.append(pressure)
+        self.writer.write(self.output_file_name, f"{now}, {pressure} ")
+
+
+class AsyncPheonix(AsyncSerialDevice):
+    """
+    Phoenix II controller, every command is answered by one line.
+
+    Commands wait for their own answer: answers come back in the order the
+    commands were sent, so each command queues a future that the next
+    line resolves. A command that timed out still owes its answer, the next
+    command waits for it and throws it away before it is sent, so the late
+    answer isn't taken for its own.
+    """
+
+    def __init__(self, serial_loop, port="COM5", baudrate=9600, timeout=2.0):
+        super().__init__(serial_loop, port, baudrate)
+        self.timeout = timeout
+        self.pending = []
+        self.command_lock = None
+        self.owed = 0
+        self.answered = None
+
+    async def _command(self, byte: bytes):
+        if self.command_lock is None:
+            self.command_lock = asyncio.Lock()
+            self.answered = asyncio.Event()
+        async with self.command_lock:
+            if self.owed:
+                await self._resync()
+            future = self.serial_loop.loop.create_future()
+            self.pending.append(future)
+            self.protocol.transport.write(byte)
+            try:
+                return await asyncio.wait_for(future, self.timeout)
+            except asyncio.TimeoutError:
+                print(f"no answer to {byte!r}")
+                if future in self.pending:
+                    self.pending.remove(future)
+                    self.owed += 1
+                return None
+
+    async def _resync(self):
+        """
+        wait up to timeout for the answers of timed out commands, if they
+        don't come at all they are given up on
+        """
+        self.answered.clear()
+        try:
+            await asyncio.wait_for(self.answered.wait(), self.timeout)
+        except asyncio.TimeoutError:
+            print(f"gave up on {self.owed} late answers")
+        self.owed = 0
+
+    def on_line(self, line):
+        if self.owed:
+            self.owed -= 1
+            print(f"late answer, {line}")
+            if not self.owed:
+                self.answered.set()
+        elif self.pending:
+            self.pending.pop(0).set_result(line)
+        else:
+            print(f"unexpected message, {line}")
+
+    def command(self, byte: bytes):
+        return self.serial_loop.call(self._command(byte))
+
+    def on(self):
+        print(self.command(b"GO\r"))
+
+    def off(self):
+        print(self.command(b"ST\r"))
+
+    def set_temp(self, temp):
+        print(self.command(f"S  {temp}\r".encode()))
+
+    def get_temp(self):
+        return self.command(b"I\r")
@@ -1,9 +1,27 @@
 import PySpin
 import numpy as np
+import time
+from .camera_base import Camera
+from .roi import Roi
 
 
-class FlirCamera:
-    def __init__(self):
+class FlirCamera(Camera):
+    def __init__(self, raw=False, dtype=np.float64):
+        """
+        raw=True makes capture_data return the uint16 counts,
+        degrees C are then counts * SCALE + OFFSET
+        """
+        self.raw = raw
+        self.dtype = dtype
+        self.raw_data = None
+        self.image_data = None
+        self.frame_id = None
+        self.timestamp = None
+        self.incomplete = 0
+        self._clock_offset = None
+        # lookup table from every possible 16 bit count to degrees C
+        self.lut = (np.arange(1 << 16) * self.SCALE + self.OFFSET).astype(dtype)
+
         self.system: PySpin.System = PySpin.System.GetInstance()
 
         cam_list = self.system.GetCameras()
@@ -65,6 +83,18 @@ class FlirCamera:
         # Set integer value from entry node as new value of enumeration node
         node_acquisition_mode.SetIntValue(acquisition_mode_continuous)
         print("Acquisition mode set to continuous...")
+        self.sensor_shape = (
+            self._int_value("SensorHeight") or self._int_value("HeightMax"),
+            self._int_value("SensorWidth") or self._int_value("WidthMax"),
+        )
+        self.roi = Roi(
+            self._int_value("OffsetX") or 0,
+            self._int_value("OffsetY") or 0,
+            self._int_value("Width"),
+            self._int_value("Height"),
+            1,
+        )
+        self.frame_rate = self._float_value("AcquisitionFrameRate")
         # technically (probably) shouldnt do this but it creates less lag for the camera
         self.cam.BeginAcquisition()
 
@@ -76,23 +106,55 @@ class FlirCamera:
         self.system.ReleaseInstance()
 
     def capture_data(self):
+        """
+        the next complete frame, None if the camera sent an incomplete one
+        frame_id and timestamp (unix time the camera took it) describe the frame returned
+        """
         # get the image
         image_result = self.cam.GetNextImage(1000)
         if image_result.IsIncomplete():
+            self.incomplete += 1
             print(
                 "Image incomplete with image status %d ..."
                 % image_result.GetImageStatus()
             )
-        else:
-            # convert to array
-            image_data: np.ndarray = image_result.GetNDArray()
-            # convert to degrees C
-            image_data = image_data * 0.1
-            subract = np.ones(image_data.shape) * 273.15
-            self.image_data = np.subtract(image_data, subract)
             image_result.Release()
+            return None
+        self.frame_id = image_result.GetFrameID()
+        self.timestamp = self._host_time(image_result.GetTimeStamp())
+        # copy the counts out before the image buffer goes back to the camera
+        image_data: np.ndarray = image_result.GetNDArray()
+        if self.raw_data is None or self.raw_data.shape != image_data.shape:
+            self.raw_data = np.empty(image_data.shape, np.uint16)
+            self.image_data = np.empty(image_data.shape, self.dtype)
+        np.copyto(self.raw_data, image_data, casting="unsafe")
+        image_result.Release()
+        if self.raw:
+            return self.raw_data
+        # convert to degrees C into the same buffer every frame
+        np.take(self.lut, self.raw_data, out=self.image_data, mode="clip")
         return self.image_data
 
+    def _host_time(self, device_ns):
+        if self._clock_offset is None:
+            self._sync_clock(device_ns)
+        return self._clock_offset + device_ns / 1e9
+
+    def _sync_clock(self, device_ns):
+        """
+        offset from the camera clock (ns) to unix time, from a latched camera
+        timestamp if the camera has one, otherwise from this frame's arrival
+        """
+        latch = PySpin.CCommandPtr(self.nodemap.GetNode("TimestampLatch"))
+        value = PySpin.CIntegerPtr(self.nodemap.GetNode("TimestampLatchValue"))
+        if PySpin.IsWritable(latch) and PySpin.IsReadable(value):
+            before = time.time()
+            latch.Execute()
+            after = time.time()
+            self._clock_offset = (before + after) / 2 - value.GetValue() / 1e9
+        else:
+            self._clock_offset = time.time() - device_ns / 1e9
+
     def auto_focus(self):
         """
         run the auto focus cmd on the camera 
@@ -112,6 +174,93 @@ class FlirCamera:
         """
         PySpin.CFloatPtr(self.nodemap.GetNode("ObjectDistance")).SetValue(distance)
 
+    def set_reflected_temperature(self, temperature):
+        """
+        set the reflected (background) temperature, in the unit of the camera's node
+        """
+        PySpin.CFloatPtr(self.nodemap.GetNode("ReflectedTemperature")).SetValue(temperature)
+
+    def set_focus(self, position):
+        """
+        move the focus motor to position
+        """
+        PySpin.CIntegerPtr(self.nodemap.GetNode("FocusPos")).SetValue(int(position))
+
+
+    def _float_value(self, name):
+        node = PySpin.CFloatPtr(self.nodemap.GetNode(name))
+        if not PySpin.IsReadable(node):
+            return None
+        return node.GetValue()
+
+    def _int_value(self, name):
+        node = PySpin.CIntegerPtr(self.nodemap.GetNode(name))
+        if not PySpin.IsReadable(node):
+            return None
+        return node.GetValue()
+
+    def _set_int(self, name, value, round_up=False):
+        """
+        set an integer node to the nearest valid value (down, or up with
+        round_up) within its range and increment, returns what was set or
+        None if the node can't be written
+        """
+        node = PySpin.CIntegerPtr(self.nodemap.GetNode(name))
+        if not PySpin.IsWritable(node):
+            return None
+        low, high, increment = node.GetMin(), node.GetMax(), node.GetInc()
+        steps = -(-(value - low) // increment) if round_up else (value - low) // increment
+        value = min(max(low + steps * increment, low), high)
+        node.SetValue(int(value))
+        return int(value)
+
+    def _align(self, name, value):
+        # largest valid value of an integer node not above value
+        node = PySpin.CIntegerPtr(self.nodemap.GetNode(name))
+        if not PySpin.IsReadable(node):
+            return 0
+        low, increment = node.GetMin(), node.GetInc()
+        return max(low + (value - low) // increment * increment, low)
+
+    def _set_binning(self, binning):
+        # binning averages the pixels, decimation only skips them, binning is preferred
+        for horizontal, vertical in (
+            ("BinningHorizontal", "BinningVertical"),
+            ("DecimationHorizontal", "DecimationVertical"),
+        ):
+            applied = self._set_int(horizontal, binning)
+            if applied is not None:
+                self._set_int(vertical, applied)
+                return applied
+        return 1
+
+    def set_roi(self, roi):
+        """
+        acquire only roi (sensor pixels), binned or decimated by roi.binning where
+        the camera can, offsets and sizes are rounded outwards to what the
+        camera accepts, returns the roi in use
+        """
+        self.cam.EndAcquisition()
+        try:
+            binning = self._set_binning(roi.binning)
+            # offsets go to 0 first so every width and height is allowed
+            self._set_int("OffsetX", 0)
+            self._set_int("OffsetY", 0)
+            x = self._align("OffsetX", roi.x // binning)
+            y = self._align("OffsetY", roi.y // binning)
+            width = self._set_int("Width", -(-(roi.x + roi.width) // binning) - x, round_up=True)
+            height = self._set_int("Height", -(-(roi.y + roi.height) // binning) - y, round_up=True)
+            x = self._set_int("OffsetX", x) or 0
+            y = self._set_int("OffsetY", y) or 0
+        finally:
+            self.cam.BeginAcquisition()
+        # a smaller roi can raise the rate the camera runs at
+        self.frame_rate = self._float_value("AcquisitionFrameRate")
+        width = width or self._int_value("Width")
+        height = height or self._int_value("Height")
+        self.roi = Roi(x * binning, y * binning, width * binning, height * binning, binning)
+        return self.roi
+
 
 if __name__ == "__main__":
     camera = FlirCamera()
@@ -0,0 +1,55 @@
+from abc import ABC, abstractmethod
+
+
+class Camera(ABC):
+    """
+    What DataController needs from a camera.
+
+    capture_data blocks until the next frame and returns it in degrees C
+    (float) or as raw uint16 counts, where degrees C = counts * SCALE + OFFSET,
+    or None when the frame was lost. Cameras that know them set frame_id and
+    timestamp (unix time the frame was taken) for the frame returned, and
+    count frames they received incomplete. frame_rate is the rate the camera
+    takes frames at, frame ids count every one of them.
+    """
+
+    SCALE = 0.1
+    OFFSET = -273.15
+    raw = False
+    # (height, width) of the full sensor, roi is the part of it being acquired
+    sensor_shape = None
+    roi = None
+    frame_id = None
+    timestamp = None
+    incomplete = 0
+    frame_rate = None
+
+    @abstractmethod
+    def capture_data(self):
+        pass
+
+    @abstractmethod
+    def cleanup(self):
+        pass
+
+    def auto_focus(self):
+        raise NotImplementedError("auto focus is not supported by this camera")
+
+    def set_emissivity(self, emissivity: float):
+        raise NotImplementedError("emissivity is not supported by this camera")
+
+    def set_distance(self, distance):
+        raise NotImplementedError("object distance is not supported by this camera")
+
+    def set_reflected_temperature(self, temperature):
+        raise NotImplementedError("reflected temperature is not supported by this camera")
+
+    def set_focus(self, position):
+        raise NotImplementedError("focus position is not supported by this camera")
+
+    def set_roi(self, roi):
+        """
+        acquire only roi (a classes.roi.Roi in sensor pixels),
+        returns the roi the camera actually uses
+        """
+        raise NotImplementedError("regions of interest are not supported by this camera")
@@ -0,0 +1,85 @@
+from datetime import datetime
+import threading
+import time
+
+# setting name: Camera method that applies it
+SETTERS = {
+    "emissivity": "set_emissivity",
+    "distance": "set_distance",
+    "reflected_temperature": "set_reflected_temperature",
+    "focus": "set_focus",
+}
+
+
+class CameraSettings:
+    """
+    Radiometric and focus settings of the running camera.
+
+    Settings are applied straight to the open camera, so they can change
+    mid capture without reopening the device. Every change is kept in
+    `changes` and written with its timestamp to the settings log of the
+    current capture, which also starts with the values in effect when the
+    capture was created.
+    """
+
+    def __init__(self, writer=None):
+        self.writer = writer
+        self.camera = None
+        self.values = {}
+        self.changes = []
+        self.log_path = None
+        self.lock = threading.Lock()
+
+    def attach(self, camera):
+        """
+        use camera from now on, the settings made so far are applied to it
+        """
+        with self.lock:
+            self.camera = camera
+            for name, value in self.values.items():
+                self._apply(name, value)
+
+    def _apply(self, name, value):
+        if name not in SETTERS:
+            raise KeyError(f"unknown camera setting {name}, expected one of {', '.join(SETTERS)}")
+        if self.camera is not None:
+            getattr(self.camera, SETTERS[name])(value)
+
+    def set(self, name, value):
+        """
+        apply a setting to the camera, or keep it until a camera is attached
+        """
+        value = float(value)
+        with self.lock:
+            self._apply(name, value)
+            self.values[name] = value
+            self._log(name, value)
+
+    def update(self, values):
+        for name, value in values.items():
+            self.set(name, value)
+
+    def auto_focus(self):
+        with self.lock:
+            self.camera.auto_focus()
+            self._log("auto_focus", "")
+
+    def start_log(self, path):
+        """
+        log changes to path from now on, starting with the current values
+        """
+        with self.lock:
+            self.log_path = path
+            if self.writer is not None:
+                self.writer.create(path, "Timestamp,Epoch,Setting,Value")
+            for name, value in self.values.items():
+                self._log(name, value, record=False)
+
+    def _log(self, name, value, record=True):
+        now = time.time()
+        if record:
+            self.changes.append((now, name, value))
+        if self.writer is not None and self.log_path is not None:
+            self.writer.write(
+                self.log_path, f"{datetime.fromtimestamp(now).time()},{now:.3f},{name},{value}"
+            )
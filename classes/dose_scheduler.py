@@ -0,0 +1,113 @@
+from .threads import StoppableThread
+from datetime import datetime
+import threading
+import time
+
+
+class DoseScheduler(StoppableThread):
+    """
+    Doses on dosingStatus transitions instead of polling.
+
+    For every cycle: send b"1", wait for the Arduino to report the dose
+    running ("1") and then finished (anything else), then wait that
+    cycle's dwell time before the next dose. The waits are woken by the
+    status change itself, so doses go out within milliseconds of the
+    dwell ending. Every dose and its completion are logged with their
+    timestamps so analysis can align the cycles.
+    """
+
+    def __init__(
+        self,
+        arduino,
+        cycles,
+        dwell=300,
+        writer=None,
+        log_path=None,
+        start_timeout=10,
+        start_cycle=0,
+        delay=0,
+        checkpoint=None,
+    ):
+        """
+        dwell is seconds after a dose finished before the next one, either one
+        value for every cycle or a list with one value per cycle
+        start_timeout is how long to wait for the dose to show up as running
+        start_cycle and delay resume a run: cycles already done and the dwell
+        still left before the next dose
+        checkpoint is called as (cycle, event, time) for every logged event
+        """
+        super().__init__()
+        self.daemon = True
+        self.arduino = arduino
+        self.cycles = cycles
+        self.start_cycle = start_cycle
+        self.cycle = start_cycle
+        self.delay = delay
+        self.checkpoint = checkpoint
+        if isinstance(dwell, (int, float)):
+            dwell = [dwell] * cycles
+        # short lists keep using their last dwell
+        self.dwell = list(dwell) + [dwell[-1]] * (cycles - len(dwell))
+        self.writer = writer
+        self.log_path = log_path
+        self.start_timeout = start_timeout
+        self.condition = threading.Condition()
+        self.status = str(arduino.dosingStatus)
+        self.doses = []
+
+    def on_status(self, status):
+        """
+        called by the Arduino whenever dosingStatus changes
+        """
+        with self.condition:
+            self.status = str(status)
+            self.condition.notify_all()
+
+    def stop(self):
+        super().stop()
+        with self.condition:
+            self.condition.notify_all()
+
+    def _wait_status(self, running, timeout=None):
+        with self.condition:
+            return self.condition.wait_for(
+                lambda: self.stopped() or (self.status == "1") == running, timeout
+            )
+
+    def _log(self, event):
+        now = time.time()
+        self.doses.append((self.cycle, event, now))
+        if self.writer is not None and self.log_path is not None:
+            self.writer.write(
+                self.log_path, f"{datetime.fromtimestamp(now).time()},{now:.3f},{self.cycle},{event}"
+            )
+        if self.checkpoint is not None:
+            self.checkpoint(self.cycle, event, now)
+
+    def run(self):
+        if self.writer is not None and self.log_path is not None and self.start_cycle == 0:
+            self.writer.create(self.log_path, "Timestamp,Epoch,Cycle,Event")
+        self.arduino.status_listeners.append(self.on_status)
+        try:
+            if self._stop_event.wait(self.delay):
+                return
+            for cycle in range(self.start_cycle, self.cycles):
+                if self.stopped():
+                    break
+                self.arduino.write(b"1")
+                self.cycle = cycle + 1
+                self._log("dose")
+
+                if not self._wait_status(True, self.start_timeout):
+                    print("dose did not show as running, carrying on")
+                self._wait_status(False)
+                if self.stopped():
+                    break
+                self._log("done")
+
+                # the stop event doubles as an interruptible timer
+                if self._stop_event.wait(self.dwell[cycle]):
+                    break
+        finally:
+            self.arduino.status_listeners.remove(self.on_status)
+            self.stop()
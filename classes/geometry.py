@@ -0,0 +1,186 @@
+from scipy.spatial import cKDTree
+import numpy as np
+import cv2
+
+
+def order_corners(corners):
+    """
+    sort 4 clicked corners into (top left, top right, bottom left, bottom right)
+
+    the smallest x + y is top left and the largest bottom right, of the two
+    left over the one further right is top right
+    """
+    corners = np.asarray(corners, dtype=np.float64).reshape(4, 2)
+    sums = corners.sum(axis=1)
+    topleft = corners[np.argmin(sums)]
+    bottomright = corners[np.argmax(sums)]
+    rest = np.delete(corners, [np.argmin(sums), np.argmax(sums)], axis=0)
+    topright, bottomleft = sorted(rest, key=lambda point: -point[0])
+    return np.array([topleft, topright, bottomleft, bottomright])
+
+
+class PlateGeometry:
+    """
+    Well centers of a plate from a perspective homography.
+
+    The homography maps well indices (x index, y index) to image pixels, it is
+    fitted from the 4 corner wells, or from every detected well, and all
+    centers come out of it in one vectorized call. Unlike blending the edge
+    vectors it stays correct when the camera looks at the plate at an angle.
+    """
+
+    def __init__(self, well_count_x=12, well_count_y=8):
+        self.well_count_x = well_count_x
+        self.well_count_y = well_count_y
+        self.homography = None
+
+    def grid(self):
+        """
+        (well_count_x, well_count_y, 2) well indices as (x index, y index)
+        """
+        return np.stack(
+            np.meshgrid(
+                np.arange(self.well_count_x, dtype=np.float64),
+                np.arange(self.well_count_y, dtype=np.float64),
+                indexing="ij",
+            ),
+            axis=-1,
+        )
+
+    def grid_corners(self):
+        last_x, last_y = self.well_count_x - 1, self.well_count_y - 1
+        return np.array([[0, 0], [last_x, 0], [0, last_y], [last_x, last_y]], dtype=np.float64)
+
+    def fit(self, corners):
+        """
+        fit the homography from the 4 corner well centers, in any order
+        """
+        corners = order_corners(corners)
+        self.homography = cv2.getPerspectiveTransform(
+            self.grid_corners().astype(np.float32), corners.astype(np.float32)
+        )
+        return corners
+
+    def fit_points(self, grid_points, image_points):
+        """
+        fit the homography to any number of matched (well index, pixel) pairs,
+        outliers are rejected with RANSAC
+        """
+        homography, _ = cv2.findHomography(
+            np.asarray(grid_points, dtype=np.float64),
+            np.asarray(image_points, dtype=np.float64),
+            cv2.RANSAC,
+            3.0,
+        )
+        if homography is None:
+            raise ValueError("could not fit the plate to the detected wells")
+        self.homography = homography
+
+    def project(self, points):
+        """
+        well indices (..., 2) to pixels (..., 2)
+        """
+        points = np.asarray(points, dtype=np.float64)
+        flat = points.reshape(-1, 2)
+        projected = np.column_stack((flat, np.ones(len(flat)))) @ self.homography.T
+        return (projected[:, :2] / projected[:, 2:]).reshape(points.shape)
+
+    def centers(self):
+        """
+        (well_count_x, well_count_y, 2) well centers as (x, y), laid out like DataController.coords
+        """
+        return self.project(self.grid())
+
+    def pitch(self):
+        """
+        average distance between neighbouring wells in pixels
+        """
+        centers = self.centers()
+        steps = []
+        if self.well_count_x > 1:
+            steps.append(np.linalg.norm(np.diff(centers, axis=0), axis=-1).ravel())
+        if self.well_count_y > 1:
+            steps.append(np.linalg.norm(np.diff(centers, axis=1), axis=-1).ravel())
+        return float(np.mean(np.concatenate(steps)))
+
+
+def detect_wells(frame, well_count_x, well_count_y, min_radius=3, max_radius=None):
+    """
+    find the well grid in a thermal frame
+
+    circles are found with a Hough transform on the normalized frame, the
+    outermost circles give a first fit, every circle is then matched to its
+    nearest well and the fit is refined on all of them, so as long as the
+    corner wells are found a few missed or spurious circles don't matter
+    returns the fitted PlateGeometry and the median circle radius
+    """
+    image = cv2.normalize(np.asarray(frame, dtype=np.float32), None, 0, 255, cv2.NORM_MINMAX, cv2.CV_8U)
+    image = cv2.GaussianBlur(image, (5, 5), 0)
+    height, width = image.shape
+    # the plate can't be wider than the frame, which bounds the well pitch
+    pitch = min(width / well_count_x, height / well_count_y)
+    circles = cv2.HoughCircles(
+        image,
+        cv2.HOUGH_GRADIENT,
+        dp=1,
+        minDist=0.6 * pitch,
+        param1=60,
+        param2=15,
+        minRadius=min_radius,
+        maxRadius=int(max_radius or pitch / 2),
+    )
+    if circles is None or len(circles[0]) < 4:
+        raise ValueError("no well grid found in the frame")
+    circles = circles[0]
+    points = circles[:, :2].astype(np.float64)
+
+    geometry = PlateGeometry(well_count_x, well_count_y)
+    sums = points.sum(axis=1)
+    differences = points[:, 0] - points[:, 1]
+    geometry.fit(
+        [
+            points[np.argmin(sums)],
+            points[np.argmax(differences)],
+            points[np.argmin(differences)],
+            points[np.argmax(sums)],
+        ]
+    )
+
+    # match circles to the wells they are closest to, within half a pitch
+    grid = geometry.grid().reshape(-1, 2)
+    distance, nearest = cKDTree(geometry.project(grid)).query(points)
+    matched = distance < geometry.pitch() / 2
+    if matched.sum() < 4:
+        raise ValueError("the circles found don't line up as a well grid")
+    geometry.fit_points(grid[nearest[matched]], points[matched])
+    return geometry, float(np.median(circles[matched, 2]))
+
+
+class WellIndex:
+    """
+    KD-tree over the well centers for click hit testing, rebuilt only when
+    the coords change
+    """
+
+    def __init__(self):
+        self.tree = None
+        self.shape = None
+        self._key = None
+
+    def nearest(self, coords, x, y, max_distance=np.inf):
+        """
+        index (x index, y index) of the well in coords closest to the point x, y,
+        None if there is none within max_distance
+        """
+        coords = np.ascontiguousarray(coords, dtype=np.float64)
+        if coords.size == 0:
+            return None
+        key = (coords.shape, coords.tobytes())
+        if key != self._key:
+            self.tree = cKDTree(coords.reshape(-1, 2))
+            self.shape = coords.shape[:-1]
+            self._key = key
+        distance, index = self.tree.query((x, y), distance_upper_bound=max_distance)
+        if not np.isfinite(distance):
+            return None
+        return tuple(int(i) for i in np.unravel_index(index, self.shape))
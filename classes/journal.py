@@ -0,0 +1,73 @@
+import threading
+import json
+import time
+import os
+
+
+class RunJournal:
+    """
+    The state of the running experiment, kept in a small json file so a run
+    can be picked up again after the UI process dies.
+
+    Every section (degas, dose, capture, reading, queue, layout) is written
+    as it changes and removed when it ends, so whatever is left in the file
+    on start up is what was running. Writes go to a temporary file that
+    replaces the journal, a crash never leaves half a journal behind.
+    """
+
+    def __init__(self, path="data/run_journal.json"):
+        self.path = path
+        self.lock = threading.Lock()
+        self.frozen = False
+        self.state = self.load() or {}
+
+    def load(self):
+        try:
+            with open(self.path) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def update(self, **sections):
+        """
+        set sections, None removes a section
+        """
+        with self.lock:
+            if self.frozen:
+                return
+            for key, value in sections.items():
+                if value is None:
+                    self.state.pop(key, None)
+                else:
+                    self.state[key] = value
+            self.state["updated"] = time.time()
+            self._save()
+
+    def freeze(self):
+        """
+        ignore updates from now on, so stopping everything on shutdown keeps the journal
+        """
+        with self.lock:
+            self.frozen = True
+
+    def get(self, key, default=None):
+        with self.lock:
+            return self.state.get(key, default)
+
+    def active(self):
+        """
+        whether the journal holds anything to resume
+        """
+        with self.lock:
+            return any(key in self.state for key in ("degas", "dose", "capture", "queue"))
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as file:
+            json.dump(self.state, file, indent=1)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.path)
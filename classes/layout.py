@@ -0,0 +1,57 @@
+import numpy as np
+import json
+import os
+
+LAYOUT_VERSION = 1
+
+
+def save_layout(path, corners, coords, radius, well_counts, mask, camera=None, homography=None):
+    """
+    write a plate layout and its built masks to one compressed .npz file
+
+    the masks are stored with the smallest integer types that hold them, a
+    96 well plate is a few tens of kB
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    meta = {
+        "version": LAYOUT_VERSION,
+        "radius": float(radius),
+        "wells": [int(count) for count in well_counts],
+        "shape": list(mask.shape),
+        "camera": camera or {},
+    }
+    arrays = {
+        "corners": np.asarray(corners, dtype=np.float64).reshape(-1, 2),
+        "coords": coords,
+        "pixels": mask.pixels.astype(np.uint32),
+        "labels": mask.labels.astype(np.uint16 if len(mask) <= 1 << 16 else np.uint32),
+        "counts": mask.counts.astype(np.uint32),
+        "meta": np.array(json.dumps(meta)),
+    }
+    if homography is not None:
+        arrays["homography"] = np.asarray(homography, dtype=np.float64)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    np.savez_compressed(path, **arrays)
+
+
+def load_layout(path):
+    """
+    read a layout written by save_layout
+    returns a dict of corners, coords, radius, wells, shape, camera, homography
+    and the mask arrays pixels, labels, counts
+    """
+    with np.load(path) as data:
+        meta = json.loads(str(data["meta"]))
+        if meta.get("version") != LAYOUT_VERSION:
+            raise ValueError(f"{path} is layout version {meta.get('version')}, expected {LAYOUT_VERSION}")
+        layout = {key: data[key] for key in ("corners", "coords", "pixels", "labels", "counts")}
+        layout["homography"] = data["homography"] if "homography" in data else None
+    layout.update(
+        radius=meta["radius"],
+        wells=tuple(meta["wells"]),
+        shape=tuple(meta["shape"]),
+        camera=meta["camera"],
+    )
+    return layout
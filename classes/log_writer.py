@@ -0,0 +1,100 @@
+from .threads import StoppableThread
+import queue
+import time
+import os
+
+
+class LogWriter(StoppableThread):
+    """
+    Single writer thread for all the csv logs.
+
+    Producers call write() which only puts the row on a queue, the thread
+    batches rows into long lived buffered file handles and flushes them
+    every flush_interval seconds or flush_rows rows, whichever comes first.
+    """
+
+    def __init__(self, flush_interval=1.0, flush_rows=500, max_queue=100000):
+        super().__init__()
+        self.daemon = True
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+        self.queue = queue.Queue(max_queue)
+        self.files = {}
+        self.dropped = 0
+        self.written = 0
+
+    @property
+    def queue_depth(self):
+        return self.queue.qsize()
+
+    def write(self, path, line, block=False):
+        """
+        queue a line (without newline) to be appended to path,
+        only waits for room in the queue when block is set
+        """
+        try:
+            self.queue.put((path, line), block)
+        except queue.Full:
+            self.dropped += 1
+
+    def create(self, path, header):
+        """
+        truncate path and write the header through the writer thread
+        """
+        self.write(path, None)
+        self.write(path, header)
+
+    def _handle(self, path):
+        file = self.files.get(path)
+        if file is None:
+            file = open(path, "a", buffering=1 << 16)
+            self.files[path] = file
+        return file
+
+    def _drain(self, timeout):
+        rows = 0
+        try:
+            path, line = self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return rows
+        while True:
+            if line is None:
+                # reopen truncated, used when a new file is created
+                file = self.files.pop(path, None)
+                if file is not None:
+                    file.close()
+                self.files[path] = open(path, "w", buffering=1 << 16)
+            else:
+                self._handle(path).write(line + "\n")
+                self.written += 1
+                rows += 1
+            if rows >= self.flush_rows:
+                return rows
+            try:
+                path, line = self.queue.get_nowait()
+            except queue.Empty:
+                return rows
+
+    def flush(self, sync=False):
+        for file in self.files.values():
+            file.flush()
+            if sync:
+                os.fsync(file.fileno())
+
+    def run(self):
+        pending = 0
+        last_flush = time.monotonic()
+        while not self.stopped():
+            pending += self._drain(self.flush_interval)
+            now = time.monotonic()
+            if pending >= self.flush_rows or now - last_flush >= self.flush_interval:
+                self.flush()
+                pending = 0
+                last_flush = now
+        # write out whatever is left and make sure it reaches the disk
+        while not self.queue.empty():
+            self._drain(0)
+        self.flush(sync=True)
+        for file in self.files.values():
+            file.close()
+        self.files = {}
@@ -0,0 +1,111 @@
+import numpy as np
+
+
+class WellMask:
+    """
+    Pixel membership for every well, built in one vectorized pass.
+
+    Wells are stored as flat pixel indices (`pixels`) with a matching
+    well index per pixel (`labels`), grouped well by well, so overlapping
+    wells keep every pixel just like the old per-well lists did.
+    """
+
+    def __init__(self) -> None:
+        self.pixels = np.empty(0, dtype=np.intp)
+        self.labels = np.empty(0, dtype=np.intp)
+        self.counts = np.empty(0, dtype=np.intp)
+        self.shape = None
+        self._key = None
+
+    def __len__(self):
+        return len(self.counts)
+
+    def _make_key(self, coords, radius, shape):
+        coords = np.ascontiguousarray(coords, dtype=np.float64)
+        return (coords.shape, coords.tobytes(), float(radius), tuple(shape))
+
+    def build(self, coords, radius, shape=(480, 640)):
+        """
+        build the masks for all well centers in coords (..., 2) as (x, y)
+        returns True if the masks were rebuilt, False if the cache was used
+        """
+        key = self._make_key(coords, radius, shape)
+        if key == self._key:
+            return False
+
+        centers = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        height, width = shape
+        # coords are (x, y) in image space, so x is the column and y the row
+        center_col = centers[:, 0]
+        center_row = centers[:, 1]
+
+        # integer offsets of a square that covers the circle of any center
+        reach = int(np.ceil(radius)) + 1
+        offsets = np.arange(-reach, reach + 1)
+        rows = np.floor(center_row)[:, None, None] + offsets[None, :, None]
+        cols = np.floor(center_col)[:, None, None] + offsets[None, None, :]
+
+        # (wells, square, square) test against every center at once
+        inside = (rows - center_row[:, None, None]) ** 2 + (
+            cols - center_col[:, None, None]
+        ) ** 2 < radius * radius
+        inside &= (rows >= 0) & (rows < height) & (cols >= 0) & (cols < width)
+
+        labels, row_index, col_index = np.nonzero(inside)
+        row_index = rows[labels, row_index, 0].astype(np.intp)
+        col_index = cols[labels, 0, col_index].astype(np.intp)
+
+        self.pixels = row_index * width + col_index
+        self.labels = labels.astype(np.intp)
+        self.counts = np.bincount(self.labels, minlength=len(centers))
+        self.shape = tuple(shape)
+        self._key = key
+        return True
+
+    def restore(self, pixels, labels, counts, coords, radius, shape):
+        """
+        use masks built earlier for coords, radius and shape (see classes/layout.py),
+        a later build() with the same parameters keeps them
+        """
+        self.pixels = np.asarray(pixels, dtype=np.intp)
+        self.labels = np.asarray(labels, dtype=np.intp)
+        self.counts = np.asarray(counts, dtype=np.intp)
+        self.shape = tuple(shape)
+        self._key = self._make_key(coords, radius, shape)
+
+    def reduce(self, frame, stats=False):
+        """
+        average every well of frame in a single pass
+        with stats=True also return min, max, std and pixel count per well
+        """
+        # float64 so squares of raw uint16 counts don't overflow
+        values = frame.ravel()[self.pixels].astype(np.float64)
+        n = len(self.counts)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            sums = np.bincount(self.labels, weights=values, minlength=n)
+            means = sums / self.counts
+            if not stats:
+                return means
+
+            squares = np.bincount(self.labels, weights=values * values, minlength=n)
+            std = np.sqrt(np.maximum(squares / self.counts - means * means, 0))
+
+        minimum = np.full(n, np.nan)
+        maximum = np.full(n, np.nan)
+        filled = self.counts > 0
+        if filled.any():
+            # pixels are grouped well by well, so each well is one contiguous segment
+            starts = (np.cumsum(self.counts) - self.counts)[filled]
+            minimum[filled] = np.minimum.reduceat(values, starts)
+            maximum[filled] = np.maximum.reduceat(values, starts)
+
+        return {
+            "mean": means,
+            "min": minimum,
+            "max": maximum,
+            "std": std,
+            "count": self.counts,
+        }
+
+    def invalidate(self):
+        self._key = None
@@ -0,0 +1,140 @@
+import numpy as np
+import threading
+
+
+class OnlinePeakAnalyzer:
+    """
+    Streaming version of the calculate_porus analysis, fed one sample per write.
+
+    Every update is a handful of vector operations over the wells: blank
+    subtraction, the running minimum as baseline, a ring buffer of the last
+    samples with their running trapezoid integral, and per well peak
+    candidates. A peak is reported once `after` (and `distance`) samples
+    have passed without a higher peak, its integral covers the samples
+    peak - before to peak + after like the offline analysis. Peaks closer
+    together than max(distance, after) samples are merged into the higher one.
+    """
+
+    def __init__(self, wells, blank, height=0.25, distance=200, before=30, after=300):
+        """
+        wells is the list of well names in write order, blank the index of the blank well
+        """
+        self.wells = list(wells)
+        self.blank = blank
+        self.height = height
+        self.before = before
+        self.after = after
+        self.hold = max(distance, after)
+        self.window = self.hold + before + 2
+        self.lock = threading.Lock()
+
+        n = len(self.wells)
+        self.count = 0
+        self.times = np.zeros(self.window)
+        self.values = np.zeros((self.window, n))
+        self.cumulative = np.zeros((self.window, n))
+        self.low = np.zeros(n)
+        self.candidate = np.full(n, -1, dtype=np.int64)
+        self.candidate_value = np.zeros(n)
+        self.cycles = np.zeros(n, dtype=np.int64)
+        self.last = np.zeros(n)
+        self.peaks = []
+
+    def update(self, timestamp, values):
+        """
+        add one sample, timestamp in seconds and one value per well
+        returns the peaks that completed with this sample
+        """
+        with self.lock:
+            return self._update(timestamp, np.asarray(values, dtype=np.float64))
+
+    def _update(self, timestamp, values):
+        normalized = values - values[self.blank]
+        if self.count == 0:
+            self.low[:] = normalized
+        else:
+            np.minimum(self.low, normalized, out=self.low)
+        # same shift as calculate_porus, with the minimum so far
+        normalized += np.abs(self.low)
+
+        index = self.count % self.window
+        previous = (self.count - 1) % self.window
+        self.times[index] = timestamp
+        self.values[index] = normalized
+        if self.count == 0:
+            self.cumulative[index] = 0
+        else:
+            step = 0.5 * (timestamp - self.times[previous])
+            self.cumulative[index] = self.cumulative[previous] + step * (
+                normalized + self.values[previous]
+            )
+
+        if self.count >= 2:
+            # the previous sample is a peak if it is a local maximum above height
+            middle = self.values[previous]
+            is_peak = (
+                (middle > self.values[(self.count - 2) % self.window])
+                & (middle >= normalized)
+                & (middle >= self.height)
+            )
+            better = is_peak & ((self.candidate < 0) | (middle > self.candidate_value))
+            self.candidate[better] = self.count - 1
+            self.candidate_value[better] = middle[better]
+
+        self.count += 1
+        ready = np.flatnonzero((self.candidate >= 0) & (self.count - self.candidate >= self.hold))
+        if len(ready) == 0:
+            return []
+
+        peak = self.candidate[ready]
+        start = np.maximum(peak - self.before, 0) % self.window
+        end = (peak + self.after - 1) % self.window
+        integrals = self.cumulative[end, ready] - self.cumulative[start, ready]
+        self.cycles[ready] += 1
+        self.last[ready] = integrals
+
+        completed = []
+        for k, well in enumerate(ready):
+            completed.append(
+                {
+                    "well": self.wells[well],
+                    "cycle": int(self.cycles[well]),
+                    "peak": int(peak[k]),
+                    "time": float(self.times[peak[k] % self.window]),
+                    "magnitude": float(self.candidate_value[well]),
+                    "integral": float(integrals[k]),
+                }
+            )
+        self.candidate[ready] = -1
+        self.peaks.extend(completed)
+        return completed
+
+    def running(self):
+        """
+        integral so far of the peak each well is currently in, 0 for wells without one
+        """
+        with self.lock:
+            if self.count == 0:
+                return np.zeros(len(self.wells))
+            pending = self.candidate >= 0
+            latest = (self.count - 1) % self.window
+            start = np.maximum(self.candidate - self.before, 0) % self.window
+            columns = np.arange(len(self.wells))
+            running = self.cumulative[latest] - self.cumulative[start, columns]
+            return np.where(pending, running, 0.0)
+
+    def summary(self):
+        """
+        one row per well: peaks found, last integral and the running integral
+        """
+        running = self.running()
+        with self.lock:
+            return [
+                {
+                    "well": well,
+                    "peaks": int(self.cycles[k]),
+                    "last": round(float(self.last[k]), 2),
+                    "running": round(float(running[k]), 2),
+                }
+                for k, well in enumerate(self.wells)
+            ]
@@ -0,0 +1,63 @@
+import string
+
+
+def row_letters(row):
+    """
+    A, B, ... Z, AA, AB, ... for row 0, 1, ...
+    """
+    letters = ""
+    row += 1
+    while row:
+        row, remainder = divmod(row - 1, 26)
+        letters = string.ascii_uppercase[remainder] + letters
+    return letters
+
+
+class PlateFormat:
+    """
+    Columns by rows of a well plate and the names of its wells.
+
+    Columns run along x and are numbered from 1, rows run along y and are
+    lettered, so a well is named column then row ("8H"). Wells are written
+    column by column, which is also the layout of DataController.coords
+    (columns, rows, 2).
+    """
+
+    def __init__(self, columns, rows, name=None):
+        self.columns = int(columns)
+        self.rows = int(rows)
+        self.name = name or f"{self.columns}x{self.rows}"
+
+    def __len__(self):
+        return self.columns * self.rows
+
+    def __repr__(self):
+        return f"PlateFormat({self.columns}, {self.rows}, {self.name!r})"
+
+    def __eq__(self, other):
+        return isinstance(other, PlateFormat) and (self.columns, self.rows) == (other.columns, other.rows)
+
+    @staticmethod
+    def of(columns, rows):
+        """
+        the standard format with this many columns and rows, else a custom one
+        """
+        for plate in PLATE_FORMATS.values():
+            if (plate.columns, plate.rows) == (columns, rows):
+                return plate
+        return PlateFormat(columns, rows)
+
+    def well_names(self):
+        """
+        well names in the order they are written
+        """
+        rows = [row_letters(row) for row in range(self.rows)]
+        return [f"{column + 1}{row}" for column in range(self.columns) for row in rows]
+
+
+PLATE_FORMATS = {
+    "24": PlateFormat(6, 4, "24"),
+    "48": PlateFormat(8, 6, "48"),
+    "96": PlateFormat(12, 8, "96"),
+    "384": PlateFormat(24, 16, "384"),
+}
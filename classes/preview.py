@@ -0,0 +1,113 @@
+from .threads import StoppableThread
+import numpy as np
+import cv2
+import base64
+import time
+
+
+class PreviewEncoder(StoppableThread):
+    """
+    Colormaps and JPEG encodes the newest frame off the UI event loop.
+
+    Only the newest frame in the FrameBuffer is ever encoded, anything that
+    arrived in between is skipped. The result is kept as a ready to use
+    data url in `source` which every connected client shares. OpenCV and
+    numpy release the GIL for the heavy parts so a thread is enough here.
+    """
+
+    def __init__(
+        self,
+        frames,
+        fps=10,
+        colormap=cv2.COLORMAP_PLASMA,
+        temp_range=None,
+        smoothing=0.2,
+        scale=1.0,
+        offset=0.0,
+    ):
+        """
+        temp_range fixes the color scale to (low, high) degrees C,
+        otherwise the frame min/max is smoothed with factor smoothing
+        scale and offset convert the frame values to degrees C
+        """
+        super().__init__()
+        self.daemon = True
+        self.frames = frames
+        self.fps = fps
+        self.temp_range = temp_range
+        self.smoothing = smoothing
+        self.scale = scale
+        self.offset = offset
+        self.range = None
+        self.source = None
+        self.seq = 0
+        # 256 entry BGR table, applyColorMap then is a single table lookup
+        self.lut = cv2.applyColorMap(
+            np.arange(256, dtype=np.uint8).reshape(256, 1), colormap
+        )
+        self._scaled = None
+        self._gray = None
+        # with a camera roi the frame is drawn where it sits on the full sensor
+        self.roi = None
+        self.sensor_shape = None
+
+    def _frame_range(self, frame):
+        if self.temp_range is not None:
+            low, high = self.temp_range
+            return (low - self.offset) / self.scale, (high - self.offset) / self.scale
+        low, high, _, _ = cv2.minMaxLoc(frame)
+        if self.range is None:
+            return low, high
+        previous_low, previous_high = self.range
+        return (
+            previous_low + self.smoothing * (low - previous_low),
+            previous_high + self.smoothing * (high - previous_high),
+        )
+
+    def encode(self, frame):
+        if self._gray is None or self._gray.shape != frame.shape:
+            self._scaled = np.empty(frame.shape, np.float32)
+            self._gray = np.empty(frame.shape, np.uint8)
+
+        self.range = self._frame_range(frame)
+        low, high = self.range
+        np.subtract(frame, low, out=self._scaled, casting="unsafe")
+        np.multiply(self._scaled, 255 / max(high - low, 1e-6), out=self._scaled)
+        np.clip(self._scaled, 0, 255, out=self._scaled)
+        np.copyto(self._gray, self._scaled, casting="unsafe")
+
+        image = self._place(cv2.applyColorMap(self._gray, self.lut))
+        _, jpg = cv2.imencode(".jpg", image)
+        return "data:image/jpg;base64," + base64.b64encode(jpg.tobytes()).decode("ASCII")
+
+    def _place(self, image):
+        roi, sensor_shape = self.roi, self.sensor_shape
+        if roi is None or sensor_shape is None:
+            return image
+        if image.shape[:2] != (roi.height // roi.binning, roi.width // roi.binning):
+            # a frame from before the roi changed
+            return image
+        if roi.binning > 1:
+            image = cv2.resize(
+                image, (image.shape[1] * roi.binning, image.shape[0] * roi.binning), interpolation=cv2.INTER_NEAREST
+            )
+        canvas = np.zeros(tuple(sensor_shape) + (3,), np.uint8)
+        height = min(image.shape[0], sensor_shape[0] - roi.y)
+        width = min(image.shape[1], sensor_shape[1] - roi.x)
+        canvas[roi.y : roi.y + height, roi.x : roi.x + width] = image[:height, :width]
+        return canvas
+
+    def run(self):
+        while not self.stopped():
+            start = time.perf_counter()
+            latest = self.frames.wait(self.seq, timeout=0.5)
+            if latest is None:
+                continue
+            self.seq, _, frame = latest
+            try:
+                self.source = self.encode(frame)
+            except Exception as e:
+                print(e)
+            delay = 1 / self.fps - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
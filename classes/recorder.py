@@ -0,0 +1,189 @@
+from .threads import StoppableThread
+from .camera_base import Camera
+from .roi import Roi
+import numpy as np
+import queue
+import json
+import time
+import os
+
+
+class FrameRecorder(StoppableThread):
+    """
+    Records every frame as raw uint16 counts into preallocated, memory
+    mapped chunk files.
+
+    push() is called from the acquisition thread and only copies the frame
+    into a free in memory buffer, converting degrees C frames back to counts
+    (counts = (degrees C - offset) / scale, exact for the camera's linear
+    lut), this thread then copies the buffers into the current chunk so all
+    disk writes happen here. meta.json is written as soon as a chunk is
+    opened and then about every second, so a crashed recording still opens
+    with the frames stored up to then.
+
+    Layout of directory:
+        meta.json            shape, dtype, scale, offset, chunk size, frame count and camera roi
+        frames_00000.npy     (chunk_frames, height, width) uint16 counts
+        timestamps_00000.npy (chunk_frames,) unix timestamps
+    """
+
+    def __init__(
+        self,
+        directory,
+        chunk_frames=500,
+        buffers=64,
+        every=1,
+        roi=None,
+        scale=Camera.SCALE,
+        offset=Camera.OFFSET,
+    ):
+        """
+        roi is the camera region the frames come from, None for the full sensor
+        scale and offset turn counts into degrees C
+        """
+        super().__init__()
+        self.daemon = True
+        self.directory = directory
+        self.chunk_frames = chunk_frames
+        self.every = every
+        self.roi = roi
+        self.scale = scale
+        self.offset = offset
+        self.free = queue.Queue()
+        self.pending = queue.Queue()
+        self.buffer_count = buffers
+        self.shape = None
+        self.dtype = None
+        self.count = 0
+        self.dropped = 0
+        self._seen = 0
+        self._chunk = None
+        self._timestamps = None
+        self._scratch = None
+        self._meta_time = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def push(self, frame, timestamp):
+        self._seen += 1
+        if (self._seen - 1) % self.every:
+            return
+        if self.shape is None:
+            self.shape = frame.shape
+            self.dtype = np.dtype(np.uint16)
+            if frame.dtype != np.uint16:
+                self._scratch = np.empty(frame.shape, np.float64)
+            for _ in range(self.buffer_count):
+                self.free.put(np.empty(frame.shape, self.dtype))
+        elif frame.shape != self.shape:
+            # the recording has one fixed frame shape
+            self.dropped += 1
+            return
+        try:
+            buffer = self.free.get_nowait()
+        except queue.Empty:
+            self.dropped += 1
+            return
+        if self._scratch is None:
+            np.copyto(buffer, frame)
+        else:
+            np.subtract(frame, self.offset, out=self._scratch)
+            np.divide(self._scratch, self.scale, out=self._scratch)
+            np.rint(self._scratch, out=self._scratch)
+            np.copyto(buffer, self._scratch, casting="unsafe")
+        self.pending.put((buffer, timestamp))
+
+    def _path(self, name, chunk):
+        return os.path.join(self.directory, f"{name}_{chunk:05d}.npy")
+
+    def _write_meta(self):
+        meta = {
+            "shape": list(self.shape),
+            "dtype": np.dtype(self.dtype).str,
+            "scale": self.scale,
+            "offset": self.offset,
+            "chunk_frames": self.chunk_frames,
+            "frames": self.count,
+            "dropped": self.dropped,
+            "roi": None if self.roi is None else list(self.roi),
+        }
+        # replaced in one step, a crash never leaves half a meta.json
+        path = os.path.join(self.directory, "meta.json")
+        with open(path + ".tmp", "w") as file:
+            json.dump(meta, file)
+        os.replace(path + ".tmp", path)
+        self._meta_time = time.monotonic()
+
+    def _store(self, frame, timestamp):
+        index = self.count % self.chunk_frames
+        if index == 0:
+            self._close_chunk()
+            chunk = self.count // self.chunk_frames
+            self._chunk = np.lib.format.open_memmap(
+                self._path("frames", chunk),
+                mode="w+",
+                dtype=self.dtype,
+                shape=(self.chunk_frames,) + tuple(self.shape),
+            )
+            self._timestamps = np.lib.format.open_memmap(
+                self._path("timestamps", chunk),
+                mode="w+",
+                dtype=np.float64,
+                shape=(self.chunk_frames,),
+            )
+        self._chunk[index] = frame
+        self._timestamps[index] = timestamp
+        self.count += 1
+        if index == 0 or time.monotonic() - self._meta_time > 1:
+            self._write_meta()
+
+    def _close_chunk(self):
+        if self._chunk is None:
+            return
+        self._chunk.flush()
+        self._timestamps.flush()
+        self._chunk = None
+        self._timestamps = None
+        self._write_meta()
+
+    def run(self):
+        while not self.stopped() or not self.pending.empty():
+            try:
+                buffer, timestamp = self.pending.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            self._store(buffer, timestamp)
+            self.free.put(buffer)
+        self._close_chunk()
+
+
+class Recording:
+    """
+    Reads back a FrameRecorder directory, iterating gives (timestamp, frame)
+    with frames as stored, degrees C = counts * scale + offset
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json")) as file:
+            meta = json.load(file)
+        self.shape = tuple(meta["shape"])
+        self.dtype = np.dtype(meta["dtype"])
+        self.scale = meta.get("scale", Camera.SCALE)
+        self.offset = meta.get("offset", Camera.OFFSET)
+        self.chunk_frames = meta["chunk_frames"]
+        self.frames = meta["frames"]
+        self.roi = Roi(*meta["roi"]) if meta.get("roi") else None
+
+    def __len__(self):
+        return self.frames
+
+    def __iter__(self):
+        for chunk in range((self.frames + self.chunk_frames - 1) // self.chunk_frames):
+            frames = np.load(
+                os.path.join(self.directory, f"frames_{chunk:05d}.npy"), mmap_mode="r"
+            )
+            timestamps = np.load(
+                os.path.join(self.directory, f"timestamps_{chunk:05d}.npy"), mmap_mode="r"
+            )
+            for index in range(min(self.chunk_frames, self.frames - chunk * self.chunk_frames)):
+                yield float(timestamps[index]), frames[index]
@@ -0,0 +1,52 @@
+from collections import namedtuple
+import numpy as np
+
+# region of the sensor that is acquired, in full sensor pixels, binned by binning
+Roi = namedtuple("Roi", "x y width height binning")
+
+
+def full_roi(sensor_shape):
+    height, width = sensor_shape
+    return Roi(0, 0, width, height, 1)
+
+
+def roi_from_coords(coords, radius, sensor_shape, margin=4, binning=1):
+    """
+    the smallest region covering every well in coords (sensor pixels) plus
+    margin pixels, aligned so binning divides it and clamped to the sensor
+    """
+    centers = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    if len(centers) == 0:
+        return full_roi(sensor_shape)
+    height, width = sensor_shape
+    reach = radius + margin
+    low = np.floor(centers.min(axis=0) - reach).astype(int)
+    high = np.ceil(centers.max(axis=0) + reach).astype(int)
+    x, y = (max(int(value), 0) // binning * binning for value in low)
+    right = min(-(-int(high[0]) // binning) * binning, width // binning * binning)
+    bottom = min(-(-int(high[1]) // binning) * binning, height // binning * binning)
+    return Roi(x, y, right - x, bottom - y, binning)
+
+
+def frame_shape(roi):
+    """
+    shape of the frames the camera sends for roi
+    """
+    return roi.height // roi.binning, roi.width // roi.binning
+
+
+def to_frame(points, roi):
+    """
+    sensor pixel (x, y) points to pixels of the roi frame, a binned pixel is
+    centered on the middle of the sensor pixels it covers
+    """
+    origin = np.array((roi.x, roi.y)) + (roi.binning - 1) / 2
+    return (np.asarray(points, dtype=np.float64) - origin) / roi.binning
+
+
+def to_sensor(points, roi):
+    """
+    roi frame pixel (x, y) points to sensor pixels
+    """
+    origin = np.array((roi.x, roi.y)) + (roi.binning - 1) / 2
+    return np.asarray(points, dtype=np.float64) * roi.binning + origin
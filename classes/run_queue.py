@@ -0,0 +1,230 @@
+from .threads import StoppableThread
+import threading
+import json
+
+STAGES = ["degas", "equilibrate", "capture", "dose", "settle", "analysis"]
+
+
+class RunQueue(StoppableThread):
+    """
+    Runs plates back to back from recipes instead of clicking through the UI.
+
+    Every recipe is a dict, only capture is required:
+
+        {
+            "name": "plate 1",
+            "layout": {"corners": [[x, y], ...], "format": "96", "radius": 10},
+            "degas": true,               # default profile, or [["08000", 28800], ...]
+            "equilibrate": 600,          # seconds between degas and capture
+            "capture": {"file": "data/plate1.csv", "pressure_file": "data/plate1_pressure.csv",
+                        "interval": 1, "mode": "mean", "blank": "8H"},
+            "dose": {"cycles": 7, "dwell": 300},
+            "settle": 300,               # seconds captured after the last dose
+            "analysis": {"normalize": "8H", "out": "out"}
+        }
+
+    The layout takes a plate format (24, 48, 96, 384) or "wells": [columns, rows].
+    Without a layout the wells set up in the UI are used. Each stage waits on
+    the stop event, so stop() ends the queue at the next stage boundary, and
+    cancels a running degas or dose. The post-run analysis goes through
+    batch_porus.batch on its own thread so the next plate starts straight
+    away, it leaves <out>/<capture name>_results.csv and an html figure, and
+    its outcome is part of status(). Other analysis keys (height, distance,
+    before, after) are passed on as analysis parameters.
+
+    The queue position, stage and time spent in it are kept in the
+    controller's journal, resume is that journal entry to carry on from.
+    """
+
+    def __init__(self, controller, recipes, index=0, resume=None):
+        super().__init__()
+        self.daemon = True
+        self.controller = controller
+        self.recipes = list(recipes)
+        self.start_index = index
+        self.index = index
+        self.resume = resume
+        self.stage = "waiting"
+        self.elapsed = 0
+        self.error = None
+        # plate name: "running", "done" or the error the analysis failed with
+        self.analyses = {}
+        self.analysis_threads = []
+
+    @staticmethod
+    def load(path):
+        """
+        recipes from a json file, either one recipe or a list of them
+        """
+        with open(path) as file:
+            recipes = json.load(file)
+        return recipes if isinstance(recipes, list) else [recipes]
+
+    def status(self):
+        if not self.recipes:
+            return "empty"
+        index = min(self.index, len(self.recipes) - 1)
+        name = self.recipes[index].get("name", f"plate {index + 1}")
+        text = f"{name} ({index + 1}/{len(self.recipes)}): {self.stage}"
+        if self.stage == "dose" and self.controller.dose_thread is not None:
+            text += f" cycle {self.controller.dose_thread.cycle}"
+        if self.error is not None:
+            text += f", {self.error}"
+        if self.analyses:
+            text += ", analysis " + ", ".join(f"{plate}: {state}" for plate, state in self.analyses.items())
+        return text
+
+    def stop(self):
+        super().stop()
+        if self.stage == "degas":
+            self.controller.cancel_degas()
+        elif self.stage == "dose":
+            self.controller.stop_dose()
+
+    def _set_stage(self, stage, elapsed=0):
+        self.stage = stage
+        self.elapsed = elapsed
+        self.controller.journal.update(
+            stage=stage,
+            queue={
+                "recipes": self.recipes,
+                "index": self.index,
+                "stage": stage,
+                "elapsed": elapsed,
+            },
+        )
+
+    def _hold(self, stage, seconds, elapsed=0):
+        """
+        wait seconds in the given stage, checkpointing every 5 s
+        returns True when stopped
+        """
+        while elapsed < seconds:
+            self._set_stage(stage, elapsed)
+            step = min(5, seconds - elapsed)
+            if self._stop_event.wait(step):
+                return True
+            elapsed += step
+        return False
+
+    def run(self):
+        try:
+            for self.index in range(self.start_index, len(self.recipes)):
+                if self.stopped():
+                    break
+                resume = self.resume if self.index == self.start_index else None
+                self.run_recipe(self.recipes[self.index], resume)
+            self.stage = "stopped" if self.stopped() else "done"
+            self.controller.journal.update(stage=self.stage, queue=None)
+        except Exception as e:
+            # the journal keeps the queue, so the run can be resumed once fixed
+            self.error = e
+            self.stage = "failed"
+            print(f"run queue failed: {e}")
+        # the queue runs until its plates are analyzed, unless it is stopped
+        for thread in self.analysis_threads:
+            while thread.is_alive() and not self.stopped():
+                thread.join(1)
+
+    def run_recipe(self, recipe, resume=None):
+        controller = self.controller
+        start = STAGES.index(resume["stage"]) if resume else 0
+        elapsed = resume.get("elapsed", 0) if resume else 0
+        layout = recipe.get("layout")
+        # once capturing, the journal holds the layout the capture was started with
+        if layout is not None and start < STAGES.index("capture"):
+            if "format" in layout:
+                controller.set_plate_format(layout["format"])
+            controller.set_layout(layout["corners"], *layout.get("wells", ()))
+            controller.radius = layout.get("radius", controller.radius)
+
+        degas = recipe.get("degas")
+        if degas and start <= STAGES.index("degas"):
+            self._set_stage("degas")
+            error = None
+            if resume is None or start != STAGES.index("degas"):
+                error = controller.degas(None if degas is True else degas)
+            elif controller.journal.get("degas") is not None:
+                checkpoint = controller.journal.get("degas")
+                error = controller.degas(
+                    checkpoint["profile"], checkpoint["step"], checkpoint["elapsed"]
+                )
+            # resuming without a degas checkpoint, it had finished
+            if self.stopped():
+                return
+            if error is not None:
+                raise RuntimeError(f"degas failed: {error}")
+
+        if start <= STAGES.index("equilibrate"):
+            held = elapsed if start == STAGES.index("equilibrate") else 0
+            if self._hold("equilibrate", recipe.get("equilibrate", 0), held):
+                return
+
+        capture = recipe["capture"]
+        path = capture["file"]
+        pressure_path = capture.get("pressure_file", path.replace(".csv", "_pressure.csv"))
+        blank = capture.get("blank", "8H")
+        if start <= STAGES.index("settle"):
+            self._set_stage("capture")
+            if controller.video_capture is None:
+                controller.start_camera()
+            controller.start_reading_arduino(None, pressure_path)
+            try:
+                controller.calculate_mask()
+                # a resumed capture appends to the file it was writing
+                if start < STAGES.index("capture"):
+                    controller.create_file(path, capture.get("mode", "mean"))
+                try:
+                    controller.start_analysis(blank)
+                except ValueError:
+                    print(f"blank well {blank} not on the plate, live analysis off")
+                controller.start_capture(path, capture.get("interval", 1), capture.get("mode", "mean"))
+
+                dose = recipe.get("dose")
+                if dose is not None and not self.stopped() and start <= STAGES.index("dose"):
+                    self._set_stage("dose")
+                    if resume is None or start != STAGES.index("dose"):
+                        controller.dose(
+                            dose.get("cycles", controller.dosing_cycles),
+                            dose.get("dwell"),
+                            pressure_path.replace(".csv", "_doses.csv"),
+                        )
+                    elif controller.journal.get("dose") is not None:
+                        controller.resume_dose(controller.journal.get("dose"))
+                    # resuming without a dose checkpoint, the last dose was done
+                    while controller.dose_thread is not None and controller.dose_thread.is_alive():
+                        controller.dose_thread.join(1)
+                held = elapsed if start == STAGES.index("settle") else 0
+                self._hold("settle", recipe.get("settle", 0), held)
+            finally:
+                controller.stop_capture()
+                controller.stop_analysis()
+                controller.stop_reading()
+
+        analysis = recipe.get("analysis")
+        if analysis is not None and not self.stopped():
+            self._set_stage("analysis")
+            params = {key: value for key, value in analysis.items() if key != "out"}
+            params.setdefault("normalize", blank)
+            name = recipe.get("name", path)
+            self.analyses[name] = "running"
+            # its own thread, so the next plate doesn't wait for the figure
+            thread = threading.Thread(
+                target=self._analyze,
+                args=(name, path, analysis.get("out", "out"), params),
+                daemon=True,
+            )
+            thread.start()
+            self.analysis_threads.append(thread)
+
+    def _analyze(self, name, path, out, params):
+        # pandas and plotly are only loaded once a plate is analyzed
+        from ..scripts.batch_porus import batch
+
+        try:
+            results = batch([path], out, params, figures=True)
+        except Exception as e:
+            self.analyses[name] = f"failed: {e}"
+            return
+        # batch reports a capture it couldn't analyze and leaves it out
+        self.analyses[name] = "done" if path in results else "failed, see console"
@@ -0,0 +1,135 @@
+from .camera_base import Camera
+from .mask import WellMask
+from .roi import full_roi
+import numpy as np
+import time
+
+
+class SyntheticCamera(Camera):
+    """
+    Camera stand-in that renders thermal frames of a well plate.
+
+    Every well sits on a slightly tilted background and gets a heat pulse
+    (fast rise, exponential decay, like an adsorption peak) every
+    pulse_period seconds of simulated time, with a per well amplitude.
+    Simulated time advances 1 / fps per frame, with realtime capture_data
+    also sleeps to keep that rate like a real camera would.
+    """
+
+    def __init__(
+        self,
+        shape=(480, 640),
+        coords=None,
+        radius=8,
+        fps=30,
+        noise=0.05,
+        background=25.0,
+        pulse_height=1.5,
+        pulse_period=300.0,
+        pulse_decay=20.0,
+        raw=False,
+        realtime=True,
+        seed=0,
+    ):
+        self.shape = shape
+        self.sensor_shape = shape
+        self.roi = full_roi(shape)
+        self.fps = fps
+        self.frame_rate = fps
+        self.realtime = realtime
+        self.noise = noise
+        self.background = background
+        self.pulse_height = pulse_height
+        self.pulse_period = pulse_period
+        self.pulse_decay = pulse_decay
+        self.raw = raw
+        self.rng = np.random.default_rng(seed)
+        self.frame_index = 0
+        self.emissivity = 0.95
+        self.distance = 0.5
+        self.reflected_temperature = 293.15
+        self.focus = 0
+
+        rows, cols = np.mgrid[0 : shape[0], 0 : shape[1]]
+        self.base = background + 0.5 * (cols / shape[1]) - 0.3 * (rows / shape[0])
+        self.image_data = np.empty(shape)
+        self.raw_data = np.empty(shape, np.uint16)
+        self.mask = WellMask()
+        if coords is None:
+            xs = np.linspace(0.1 * shape[1], 0.9 * shape[1], 12)
+            ys = np.linspace(0.1 * shape[0], 0.9 * shape[0], 8)
+            coords = np.stack(np.meshgrid(xs, ys, indexing="ij"), axis=-1)
+        self.set_wells(coords, radius)
+        self._next_frame = time.perf_counter()
+
+    def set_wells(self, coords, radius):
+        self.mask.build(coords, radius, self.shape)
+        # the last well is left empty so it can be used as a blank
+        self.amplitude = self.pulse_height * self.rng.uniform(0.5, 1.5, len(self.mask))
+        self.amplitude[-1] = 0
+
+    @property
+    def time(self):
+        return self.frame_index / self.fps
+
+    def well_temperatures(self, t):
+        # first pulse half a period in, so there is a baseline before it
+        since_pulse = (t + self.pulse_period / 2) % self.pulse_period
+        rise = 1 - np.exp(-since_pulse / 2.0)
+        return self.amplitude * rise * np.exp(-since_pulse / self.pulse_decay)
+
+    def capture_data(self):
+        if self.realtime:
+            self._next_frame += 1 / self.fps
+            delay = self._next_frame - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                self._next_frame = time.perf_counter()
+
+        frame = self.image_data
+        self.rng.standard_normal(out=frame)
+        frame *= self.noise
+        frame += self.base
+        frame.ravel()[self.mask.pixels] += self.well_temperatures(self.time)[self.mask.labels]
+        self.frame_id = self.frame_index
+        self.frame_index += 1
+        if self.roi != full_roi(self.shape):
+            frame = self._crop(frame)
+
+        if self.raw:
+            if self.raw_data.shape != frame.shape:
+                self.raw_data = np.empty(frame.shape, np.uint16)
+            np.copyto(self.raw_data, (frame - self.OFFSET) / self.SCALE, casting="unsafe")
+            return self.raw_data
+        return frame
+
+    def _crop(self, frame):
+        # the whole plate is still rendered, only what the camera would send is returned
+        x, y, width, height, binning = self.roi
+        frame = frame[y : y + height, x : x + width]
+        if binning > 1:
+            frame = frame.reshape(height // binning, binning, width // binning, binning).mean(axis=(1, 3))
+        return np.ascontiguousarray(frame)
+
+    def set_roi(self, roi):
+        self.roi = roi
+        return roi
+
+    def cleanup(self):
+        pass
+
+    def auto_focus(self):
+        pass
+
+    def set_emissivity(self, emissivity: float):
+        self.emissivity = emissivity
+
+    def set_distance(self, distance):
+        self.distance = distance
+
+    def set_reflected_temperature(self, temperature):
+        self.reflected_temperature = temperature
+
+    def set_focus(self, position):
+        self.focus = position
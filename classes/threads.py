@@ -1,4 +1,5 @@
 import threading
+import time
 
 
 
@@ -13,3 +14,25 @@ class StoppableThread(threading.Thread):
     def stopped(self):
         return self._stop_event.is_set()
 
+
+
+class PeriodicThread(StoppableThread):
+    """
+    calls function every interval seconds until stopped
+    """
+
+    def __init__(self, interval, function):
+        super().__init__()
+        self.daemon = True
+        self.interval = interval
+        self.function = function
+
+    def run(self):
+        next_call = time.monotonic()
+        while not self.stopped():
+            try:
+                self.function()
+            except Exception as e:
+                print(e)
+            next_call += self.interval
+            self._stop_event.wait(max(next_call - time.monotonic(), 0))
@@ -0,0 +1,142 @@
+import threading
+import numpy as np
+
+MODES = ("mean", "median", "reject")
+
+
+class WellAccumulator:
+    """
+    Reduces every acquired frame into per well values and emits one averaged
+    row for every interval seconds of capture time.
+
+    mean keeps running sums only. median and reject keep the well values of
+    the frames in the current window: median takes their median, reject
+    averages the frames within threshold scaled median absolute deviations of
+    the median of each well, so a glitched frame doesn't move the row.
+    interval 0 emits every frame.
+
+    push is an AcquisitionThread listener, it skips frames reduce returns
+    None for. emit is called with the mean capture time of the window and a
+    dict like WellMask.reduce(stats=True), where min, max and std are taken
+    over the frames and count is the number of frames each well was
+    averaged over.
+    """
+
+    def __init__(self, reduce, emit, interval=1.0, mode="mean", threshold=3.0):
+        if mode not in MODES:
+            raise ValueError(f"unknown mode {mode}, expected one of {', '.join(MODES)}")
+        if interval < 0:
+            raise ValueError("interval can't be negative")
+        self.reduce = reduce
+        self.emit = emit
+        self.interval = interval
+        self.mode = mode
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.closed = False
+        self.end = None
+        self._reset()
+
+    def _reset(self):
+        self.frames = 0
+        self.times = 0.0
+        self.sums = None
+        self.squares = None
+        self.minimum = None
+        self.maximum = None
+        self.values = []
+
+    def push(self, frame, timestamp):
+        values = self.reduce(frame)
+        if values is None:
+            return
+        row = None
+        with self.lock:
+            if self.closed:
+                return
+            if self.end is None:
+                self.end = timestamp + self.interval
+            elif timestamp >= self.end:
+                row = self._take()
+                if self.interval:
+                    # skip windows without frames, the next one holds this frame
+                    self.end += (np.floor((timestamp - self.end) / self.interval) + 1) * self.interval
+                else:
+                    self.end = timestamp
+            self._add(values, timestamp)
+        if row is not None:
+            self.emit(*row)
+
+    def _add(self, values, timestamp):
+        self.frames += 1
+        self.times += timestamp
+        if self.mode != "mean":
+            self.values.append(values)
+        elif self.sums is None:
+            self.sums = values.astype(np.float64)
+            self.squares = self.sums * self.sums
+            self.minimum = self.sums.copy()
+            self.maximum = self.sums.copy()
+        else:
+            self.sums += values
+            self.squares += values * values
+            np.minimum(self.minimum, values, out=self.minimum)
+            np.maximum(self.maximum, values, out=self.maximum)
+
+    def _take(self):
+        """
+        the row of the current window, None if it has no frames, and start a new one
+        """
+        if not self.frames:
+            return None
+        timestamp = self.times / self.frames
+        if self.mode == "mean":
+            count = np.full(len(self.sums), self.frames)
+            means = self.sums / self.frames
+            with np.errstate(invalid="ignore"):
+                std = np.sqrt(np.maximum(self.squares / self.frames - means * means, 0))
+            result = {"mean": means, "min": self.minimum, "max": self.maximum, "std": std, "count": count}
+        else:
+            result = self._reduce_window(np.array(self.values))
+        self._reset()
+        return timestamp, result
+
+    def _reduce_window(self, values):
+        """
+        median or outlier rejected mean over the (frames, wells) values of a window
+        """
+        with np.errstate(invalid="ignore"):
+            median = np.median(values, axis=0)
+            if self.mode == "median":
+                kept = np.ones(values.shape, dtype=bool)
+                center = median
+            else:
+                # scaled so it estimates the standard deviation of normal noise
+                deviation = np.abs(values - median)
+                spread = 1.4826 * np.median(deviation, axis=0)
+                # wells that don't change at all would otherwise reject every frame
+                kept = (deviation <= self.threshold * spread) | (spread == 0)
+                center = None
+            count = kept.sum(axis=0)
+            kept_values = np.where(kept, values, 0)
+            means = kept_values.sum(axis=0) / count
+            if center is None:
+                center = means
+            std = np.sqrt((np.where(kept, values - means, 0) ** 2).sum(axis=0) / count)
+            minimum = np.where(kept, values, np.inf).min(axis=0)
+            maximum = np.where(kept, values, -np.inf).max(axis=0)
+        # wells without pixels are nan in every frame
+        empty = count == 0
+        minimum[empty] = np.nan
+        maximum[empty] = np.nan
+        return {"mean": center, "min": minimum, "max": maximum, "std": std, "count": count}
+
+    def flush(self):
+        """
+        stop accumulating and emit the last, partial window
+        """
+        with self.lock:
+            self.closed = True
+            row = self._take()
+        if row is not None:
+            self.emit(*row)
@@ -1,66 +1,133 @@
-from .classes.camera import FlirCamera
+from .classes.camera_base import Camera
 from .classes.arduino import Arduino, readThread
 import numpy as np
 import cv2
-import base64
-import math
 import threading
 from .classes.pheonix_ii import Pheonix
 import time
-from .classes.threads import StoppableThread
-
-
-class DoseThread(StoppableThread):
-    def __init__(self, arduino, cycles):
-        super().__init__()
-        self.cycles = cycles
-        self.cycle = 0
-        self.arduino = arduino
-
-    def run(self):
-        count = 0
-        while not self.stopped():
-            if self.cycle == 0:
-                self.arduino.write(b"1")
-                self.cycle +=1
-                time.sleep(10)
-            
-            if self.arduino.dosingStatus != "1":
-                if count == 300:
-                    self.arduino.write(b"1")
-                    count = 0
-                    self.cycle += 1
-                else:
-                    count += 5
-                    
-            if self.cycle >= self.cycles:
-                self.stop()
-            time.sleep(5)
+import os
+from .classes.mask import WellMask
+from .classes.log_writer import LogWriter
+from .classes.acquisition import FrameBuffer, AcquisitionThread
+from .classes.preview import PreviewEncoder
+from .classes.recorder import FrameRecorder, Recording
+from .classes.online_analysis import OnlinePeakAnalyzer
+from .classes.dose_scheduler import DoseScheduler
+from .classes.threads import PeriodicThread
+from .classes.well_accumulator import WellAccumulator
+from .classes.run_queue import RunQueue
+from .classes.journal import RunJournal
+from .classes.geometry import PlateGeometry, WellIndex, detect_wells
+from .classes.layout import save_layout, load_layout
+from .classes.plate_format import PlateFormat, PLATE_FORMATS
+from .classes.camera_settings import CameraSettings
+from .classes.roi import full_roi, roi_from_coords, frame_shape, to_frame, to_sensor
+from datetime import datetime
+
+
+# degas set points and how long to hold them in seconds
+DEGAS_PROFILE = [("08000", 28800), ("-1000", 1800), ("02000", 1800)]
+
+
+class Canceled(Exception):
+    """
+    a degas was canceled from the UI or the run queue
+    """
 
 
 class DataController:
-    def __init__(self) -> None:
+    def __init__(self, async_serial=False, journal_path="data/run_journal.json") -> None:
+        """
+        async_serial runs the Arduino and Phoenix on one asyncio serial loop
+        instead of the blocking readThread
+        journal_path is where the running experiment is checkpointed, see resume()
+        """
         self.state = 0
         self.video_capture = None
+        self.acquisition_thread = None
+        self.acquisition_rate = 30
+        self.raw_frames = False
+        # newest frame sequence written to each file and rows that repeated it
+        self.written_frames = {}
+        self.repeated_rows = 0
+        self.preview = None
+        self.preview_fps = 10
+        self.preview_range = None
+        self.recorder = None
+        self.analyzer = None
+        self.capture_thread = None
+        self.accumulator = None
+        self.dose_thread = None
+        self.read_thread = None
+        self.run_queue = None
+        self.frames = FrameBuffer()
         self.coords = []
         self.corners = []
-        self.mask = []
+        self.mask = WellMask()
+        self.geometry = None
+        self.well_index = WellIndex()
         self.radius = 0
-        self.arduino = Arduino()
+        self.roi = None
+        self.layout_directory = "data/layouts"
         self.lock = threading.Lock()
-        self.pheonix = Pheonix()
+        self.serial_loop = None
+        if async_serial:
+            # only needs pyserial-asyncio when it is used
+            from .classes.async_serial import SerialLoop, AsyncArduino, AsyncPheonix
+
+            self.serial_loop = SerialLoop()
+            self.arduino = AsyncArduino(self.serial_loop)
+            self.pheonix = AsyncPheonix(self.serial_loop)
+        else:
+            self.arduino = Arduino()
+            self.pheonix = Pheonix()
         self.cancel = False
         self.degas_done = False
         self.dosing_cycles = 7
+        self.dose_dwell = 300
         self.cycle = 0
-        self.well_count_x = 12
-        self.well_count_y = 8
-        
+        self.plate_format = PLATE_FORMATS["96"]
+        self.write_stats = False
+        self.log_writer = LogWriter()
+        self.log_writer.start()
+        self.camera_settings = CameraSettings(self.log_writer)
+        self.journal = RunJournal(journal_path)
+
+    @property
+    def well_count_x(self):
+        return self.plate_format.columns
+
+    @well_count_x.setter
+    def well_count_x(self, x):
+        self.plate_format = PlateFormat.of(x, self.plate_format.rows)
+
+    @property
+    def well_count_y(self):
+        return self.plate_format.rows
+
+    @well_count_y.setter
+    def well_count_y(self, y):
+        self.plate_format = PlateFormat.of(self.plate_format.columns, y)
+
+    def set_plate_format(self, name):
+        """
+        use one of PLATE_FORMATS, other sizes are set with set_well_count
+        the wells are only refitted when the size changes, so edited or loaded
+        coords survive setting the size they already have
+        """
+        if PLATE_FORMATS[name] == self.plate_format:
+            return
+        self.plate_format = PLATE_FORMATS[name]
+        self._fit_corners()
+
     def set_well_count(self,x=None,y=None):
+        columns, rows = self.well_count_x, self.well_count_y
         if x is None:
             self.well_count_y = y
         elif y is None:
             self.well_count_x = x
+        if (self.well_count_x, self.well_count_y) != (columns, rows):
+            self._fit_corners()
 
     def read_cycle(self):
         return self.dose_thread.cycle
@@ -68,26 +135,270 @@ class DataController:
     def set_state(self, state):
         self.state = state
 
-    def start_camera(self):
-        self.video_capture = FlirCamera()
+    @property
+    def data(self):
+        # newest frame published by the acquisition thread
+        latest = self.frames.latest()
+        if latest is None:
+            return None
+        return latest[2]
+
+    def start_camera(self, camera=None):
+        """
+        start acquiring from camera, by default the FLIR camera
+        """
+        if camera is None:
+            # only needs PySpin when the real camera is used
+            from .classes.camera import FlirCamera
+
+            camera = FlirCamera(raw=self.raw_frames)
+        self.video_capture = camera
+        # settings made before the camera was on, e.g. from a loaded layout
+        self.camera_settings.attach(camera)
+        self.acquisition_thread = AcquisitionThread(
+            self.video_capture, self.frames, self.acquisition_rate
+        )
+        self.acquisition_thread.start()
+        scale, offset = (camera.SCALE, camera.OFFSET) if camera.raw else (1.0, 0.0)
+        self.preview = PreviewEncoder(
+            self.frames,
+            fps=self.preview_fps,
+            temp_range=self.preview_range,
+            scale=scale,
+            offset=offset,
+        )
+        self.preview.start()
+
+    def start_recording(self, directory, every=1):
+        """
+        record every `every`th frame to directory as raw counts, needs the camera running
+        """
+        camera = self.video_capture
+        self.recorder = FrameRecorder(
+            directory, every=every, roi=self.roi, scale=camera.SCALE, offset=camera.OFFSET
+        )
+        self.recorder.start()
+        self.acquisition_thread.listeners.append(self.recorder.push)
+
+    def stop_recording(self):
+        if self.recorder is None:
+            return
+        self.acquisition_thread.listeners.remove(self.recorder.push)
+        self._stop_thread(self.recorder)
+        self.recorder = None
+
+    def replay(self, directory, path):
+        """
+        feed a recording through the current wells and write it to path as fast as possible
+        """
+        recording = Recording(directory)
+        self.calculate_mask(recording.shape, recording.roi or full_roi(recording.shape))
+        self.create_file(path, mode="frame")
+        for timestamp, frame in recording:
+            self.write(
+                path,
+                datetime.fromtimestamp(timestamp).time(),
+                frame,
+                block=True,
+                capture_time=timestamp,
+            )
+        return len(recording)
 
     def focus(self):
-        self.video_capture.auto_focus()
+        self.camera_settings.auto_focus()
+
+    def set_roi(self, margin=4, binning=1):
+        """
+        only acquire the part of the sensor the wells are on, plus margin pixels,
+        binned by binning where the camera supports it
+        coords stay in full sensor pixels, the masks are built for the roi frames
+        """
+        roi = roi_from_coords(
+            self.coords, self.radius, self.video_capture.sensor_shape, margin, binning
+        )
+        return self._apply_roi(roi)
+
+    def clear_roi(self):
+        self._apply_roi(full_roi(self.video_capture.sensor_shape))
+        self.roi = None
+
+    def _apply_roi(self, roi):
+        # no frames are acquired until the masks match the new frame shape
+        with self.acquisition_thread.lock:
+            self.roi = self.video_capture.set_roi(roi)
+            if self.preview is not None:
+                self.preview.sensor_shape = self.video_capture.sensor_shape
+                self.preview.roi = self.roi
+            if len(self.coords) > 0:
+                self.calculate_mask()
+        return self.roi
+
+    def set_camera_setting(self, name, value):
+        """
+        change emissivity, distance, reflected_temperature or focus on the
+        running camera, logged next to the capture and kept with the plate layout
+        """
+        self.camera_settings.set(name, value)
 
-    def dose(self,cycles):
-        self.dose_thread = DoseThread(self.arduino,cycles)
+    def dose(self, cycles, dwell=None, log_path=None, start_cycle=0, delay=0):
+        """
+        dose cycles times, dwell seconds (one value or one per cycle) after each dose
+        has finished, dose times are logged to log_path
+        start_cycle and delay carry on a run, see resume_dose
+        """
+        dwell = self.dose_dwell if dwell is None else dwell
+
+        def checkpoint(cycle, event, now):
+            if event == "done" and cycle == cycles:
+                self.journal.update(dose=None)
+                return
+            self.journal.update(
+                stage="dose",
+                dose={
+                    "cycles": cycles,
+                    "dwell": dwell,
+                    "log_path": log_path,
+                    "cycle": cycle,
+                    "event": event,
+                    "time": now,
+                },
+            )
+
+        checkpoint(start_cycle, "start", time.time())
+        self.dose_thread = DoseScheduler(
+            self.arduino,
+            cycles,
+            dwell,
+            self.log_writer,
+            log_path,
+            start_cycle=start_cycle,
+            delay=delay,
+            checkpoint=checkpoint,
+        )
         self.dose_thread.start()
 
+    def resume_dose(self, checkpoint):
+        """
+        carry on dosing from a journal checkpoint, a dose that was sent counts
+        as done (the Arduino finishes it on its own) and only the rest of its
+        dwell is waited
+        """
+        cycle, dwell = checkpoint["cycle"], checkpoint["dwell"]
+        delay = 0
+        if cycle > 0:
+            if not isinstance(dwell, (int, float)):
+                dwell = dwell[min(cycle, len(dwell)) - 1]
+            delay = max(dwell - (time.time() - checkpoint["time"]), 0)
+        self.dose(
+            checkpoint["cycles"],
+            checkpoint["dwell"],
+            checkpoint["log_path"],
+            start_cycle=cycle,
+            delay=delay,
+        )
+
     def stop_dose(self):
-        self._stop_thread(self.dose_thread)
+        if self.dose_thread is not None:
+            self._stop_thread(self.dose_thread)
+            self.journal.update(dose=None)
+
+    def start_queue(self, recipes):
+        """
+        run the recipes one plate after another, recipes is a list or a json file
+        the queue needs the Arduino, Phoenix and capture to itself, so nothing
+        may be running from the UI
+        """
+        if self.run_queue is not None and self.run_queue.is_alive():
+            raise ValueError("a run queue is already running")
+        busy = [
+            section
+            for section in ("reading", "capture", "dose", "degas")
+            if self.journal.get(section) is not None
+        ]
+        if busy:
+            raise ValueError(f"stop {', '.join(busy)} before running the queue")
+        if isinstance(recipes, str):
+            recipes = RunQueue.load(recipes)
+        self.run_queue = RunQueue(self, recipes)
+        self.run_queue.start()
+
+    def stop_queue(self):
+        if self.run_queue is not None:
+            self._stop_thread(self.run_queue)
+            self.journal.update(queue=None)
+
+    def resume(self, output=None):
+        """
+        carry on the run left in the journal after a restart: re-attach to the
+        Arduino and Phoenix, and continue degas, dosing, capture or the run queue
+        from their last checkpoint. output is the pressure plot
+        returns the resumed sections
+        """
+        layout = self.journal.get("layout")
+        if layout is not None:
+            self.corners = [tuple(corner) for corner in layout["corners"]]
+            self.coords = np.array(layout["coords"])
+            self.radius = layout["radius"]
+            self.well_count_x, self.well_count_y = layout["wells"]
+
+        queue = self.journal.get("queue")
+        if queue is not None:
+            # the queue knows which of the other sections are its own
+            self.run_queue = RunQueue(self, queue["recipes"], queue["index"], resume=queue)
+            self.run_queue.start()
+            return ["queue"]
+
+        resumed = []
+        reading = self.journal.get("reading")
+        if reading is not None:
+            self.start_reading_arduino(output, reading)
+            resumed.append("reading")
+        capture = self.journal.get("capture")
+        if capture is not None:
+            if self.video_capture is None:
+                self.start_camera()
+            self.calculate_mask()
+            analysis = self.journal.get("analysis")
+            if analysis is not None:
+                self.start_analysis(**analysis)
+            self.start_capture(capture["file"], capture["interval"], capture.get("mode", "frame"))
+            resumed.append("capture")
+        dose = self.journal.get("dose")
+        if dose is not None:
+            self.resume_dose(dose)
+            resumed.append("dose")
+        degas = self.journal.get("degas")
+        if degas is not None:
+            threading.Thread(
+                target=self.degas,
+                args=(degas["profile"], degas["step"], degas["elapsed"]),
+                daemon=True,
+            ).start()
+            resumed.append("degas")
+        return resumed
 
     def stop_reading(self):
-        self._stop_thread(self.read_thread)
+        if self.serial_loop is not None:
+            if self.read_thread in self.arduino.listeners:
+                self.arduino.listeners.remove(self.read_thread)
+        elif self.read_thread is not None:
+            self._stop_thread(self.read_thread)
         self.arduino.close()
+        self.journal.update(reading=None)
 
     def start_reading_arduino(self, output, output_file_name):
         self.arduino.open()
-        self.read_thread = readThread(self.arduino, self.lock, output, output_file_name)
+        self.journal.update(reading=output_file_name)
+        if self.serial_loop is not None:
+            from .classes.async_serial import PressureLog
+
+            # readings arrive on the serial loop, no thread is polling
+            self.read_thread = PressureLog(output, output_file_name, self.log_writer)
+            self.arduino.listeners.append(self.read_thread)
+            return
+        self.read_thread = readThread(
+            self.arduino, self.lock, output, output_file_name, self.log_writer
+        )
         self.read_thread.start()
 
     def _stop_thread(self, thread):
@@ -104,26 +415,54 @@ class DataController:
                 self.cancel = False
                 self.pheonix.off()
                 self.pheonix.close()
-                raise "canceled"
+                raise Canceled("canceled")
 
-    def degas(self):
+    def degas(self, profile=None, step=0, elapsed=0):
+        """
+        run the degas profile, a list of (set point, seconds), default DEGAS_PROFILE
+        step and elapsed resume it, held time is checkpointed every 5 s so a
+        restart carries on where the checkpoint was, not where the clock is
+        returns the exception that ended it early, the checkpoint is kept
+        unless it was canceled
+        """
+        profile = [list(point) for point in (profile or DEGAS_PROFILE)]
         self.pheonix.open()
-        self.pheonix.set_temp("08000")
-        self.pheonix.on()
         try:
-            self._wait(5760)
-            self.pheonix.set_temp("-1000")
-            self._wait(360)
-            self.pheonix.set_temp("02000")
-            self._wait(360)
+            for i in range(step, len(profile)):
+                temp, seconds = profile[i]
+                self.pheonix.set_temp(temp)
+                if i == step:
+                    self.pheonix.on()
+                for tick in range(int(elapsed // 5), int(seconds // 5)):
+                    self.journal.update(
+                        stage="degas",
+                        degas={"profile": profile, "step": i, "elapsed": tick * 5},
+                    )
+                    self._wait(1)
+                elapsed = 0
             self.pheonix.off()
             self.degas_done = True
+            self.journal.update(degas=None)
+        except Canceled as e:
+            self.journal.update(degas=None)
+            return e
         except Exception as e:
+            # e.g. a serial error, Resume Run carries on from the checkpoint
             return e
 
     def cancel_degas(self):
         self.cancel = True
 
+    def set_layout(self, corners, well_count_x=None, well_count_y=None):
+        """
+        set the plate from its 4 corners as if they were clicked
+        """
+        self.set_well_count(x=well_count_x or self.well_count_x)
+        self.set_well_count(y=well_count_y or self.well_count_y)
+        self.corners = []
+        for x, y in corners:
+            self.edit_corners(x, y)
+
     def edit_corners(self, x, y):
         self.corners.append((x, y))
 
@@ -138,118 +477,115 @@ class DataController:
                     swap = i
             self.corners.pop(swap)
 
-        if len(self.corners) == 4:
+        self._fit_corners()
 
-            topleft = []
-            topright = []
-            bottomleft = []
-            bottomright = []
-
-            # work out which corner is which
-            sums = []
-
-            for point in self.corners:
-                sums.append(point[0] + point[1])
-            # Sum of X and Y, largest is bottom right, smallest is top left (for a rectangle-like object)
-            minimum_index = sums.index(min(sums))
-            maximum_index = sums.index(max(sums))
-
-            topleft = self.corners[minimum_index]
-            bottomright = self.corners[maximum_index]
-
-            if maximum_index > minimum_index:
-                self.corners.pop(maximum_index)
-                self.corners.pop(minimum_index)
-            else:
-                self.corners.pop(minimum_index)
-                self.corners.pop(maximum_index)
-
-            # of the 2 left, smallest x is bottom left
-            # smallest y is top right
-
-            if self.corners[0][0] > self.corners[1][0]:
-                topright = self.corners[0]
-                bottomleft = self.corners[1]
-            else:
-                topright = self.corners[1]
-                bottomleft = self.corners[0]
-
-            self.corners.append(topleft)
-            self.corners.append(bottomright)
-
-            self.coords = []
-
-            # for a polygon ABCD
-            # A-------B
-            # |       |
-            # |       |
-            # |       |
-            # C-------D
-
-            # in order to draw the grid accurately with angles
-            # calculate the vector AB, AC and CD
-            # and cacluate the magnitude of those vectors
-            # then the distance between 2 wells along those vectors
-            # by dividing by the total number of wells (distances)
-
-            # CD
-            vectA = ((bottomright[0] - bottomleft[0]), (bottomright[1] - bottomleft[1]))
-            magA = math.sqrt(vectA[0] * vectA[0] + vectA[1] * vectA[1])
-            unit_vectA = (vectA[0] / magA, vectA[1] / magA)
-            A_well_dist = magA / (self.well_count_x -1)
-
-            # AB
-            vectC = ((topright[0] - topleft[0]), (topright[1] - topleft[1]))
-            magC = math.sqrt(vectC[0] * vectC[0] + vectC[1] * vectC[1])
-            unit_vectC = (vectC[0] / magC, vectC[1] / magC)
-            C_well_dist = magC / (self.well_count_x -1)
-
-            # AC
-            vectB = ((bottomleft[0] - topleft[0]), (bottomleft[1] - topleft[1]))
-            magB = math.sqrt(vectB[0] * vectB[0] + vectB[1] * vectB[1])
-            unit_vectB = (vectB[0] / magB, vectB[1] / magB)
-            B_well_dist = magB / (self.well_count_y -1)
-
-            # for each well in the well plate find a center point
-            for x in range(self.well_count_x):
-                row = []
-                for y in range(self.well_count_y):
-                    # point = top left point + components of AB and CD depending on how far down AC we are
-                    pointx = (
-                        topleft[0]
-                        + (y / (self.well_count_y -1)) * (x * A_well_dist * unit_vectA[0])
-                        + y * B_well_dist * unit_vectB[0]
-                        + (1 - y / (self.well_count_y -1)) * (x * C_well_dist * unit_vectC[0])
-                    )
-                    pointy = (
-                        topleft[1]
-                        + (y / (self.well_count_y -1)) * (x * A_well_dist * unit_vectA[1])
-                        + y * B_well_dist * unit_vectB[1]
-                        + (1 - y / (self.well_count_y -1)) * (x * C_well_dist * unit_vectC[1])
-                    )
-                    row.append([pointx, pointy])
-                self.coords.append(row)
-            # save our coords of center point
-            self.coords = np.array(self.coords)
+    def _fit_corners(self):
+        if len(self.corners) == 4:
+            # all centers in one go from the perspective of the 4 corner wells
+            self.geometry = PlateGeometry(self.well_count_x, self.well_count_y)
+            self.corners = [tuple(corner) for corner in self.geometry.fit(self.corners).tolist()]
+            self.coords = self.geometry.centers()
 
     def edit_wells(self, x, y):
         # find the closest well and move its center to the new x,y
-        min_distance = 10000000
-        for i, column in enumerate(self.coords):
-            for j, row in enumerate(column):
-                distance = abs(row[0] - x) + abs(row[1] - y)
-                if min_distance > distance:
-                    min_distance = distance
-                    swap = (i, j)
+        well = self.well_index.nearest(self.coords, x, y)
+        if well is not None:
+            self.coords[well] = [x, y]
 
-        self.coords[swap[0]][swap[1]] = [x, y]
+    def detect_wells(self, frame=None):
+        """
+        find the well grid in frame (default the newest camera frame) instead of
+        clicking the corners, sets the corners, coords and radius
+        """
+        frame = self.data if frame is None else frame
+        self.geometry, radius = detect_wells(frame, self.well_count_x, self.well_count_y)
+        self.coords = self.geometry.centers()
+        self.corners = [tuple(corner) for corner in self.geometry.project(self.geometry.grid_corners()).tolist()]
+        # stay inside the detected rim, the wall is colder than the sample
+        self.radius = 0.8 * radius
+        if self.roi is not None:
+            # found in the roi frame, coords are kept in sensor pixels
+            self.coords = to_sensor(self.coords, self.roi)
+            self.corners = [tuple(corner) for corner in to_sensor(self.corners, self.roi).tolist()]
+            self.radius *= self.roi.binning
+            x, y, _, _, binning = self.roi
+            offset = (binning - 1) / 2
+            to_roi = np.array([[binning, 0, x + offset], [0, binning, y + offset], [0, 0, 1]])
+            self.geometry.homography = to_roi @ self.geometry.homography
+        return self.radius
+
+    def _layout_path(self, name):
+        if os.path.splitext(name)[1]:
+            return name
+        return os.path.join(self.layout_directory, name + ".npz")
+
+    def save_layout(self, name):
+        """
+        save the plate (corners, coords, radius, well counts, camera settings)
+        with its built masks, name is a layout in layout_directory or a path
+        """
+        self.calculate_mask()
+        path = self._layout_path(name)
+        save_layout(
+            path,
+            self.corners,
+            self.coords,
+            self.radius,
+            (self.well_count_x, self.well_count_y),
+            self.mask,
+            self.camera_settings.values,
+            None if self.geometry is None else self.geometry.homography,
+        )
+        return path
+
+    def load_layout(self, name):
+        """
+        restore a saved plate, its masks are used as they are unless the
+        camera frame shape is different or they don't fit the coords
+        """
+        layout = load_layout(self._layout_path(name))
+        self.well_count_x, self.well_count_y = layout["wells"]
+        self.corners = [tuple(corner) for corner in layout["corners"].tolist()]
+        self.coords = layout["coords"]
+        self.radius = layout["radius"]
+        self.geometry = None
+        if layout["homography"] is not None:
+            self.geometry = PlateGeometry(self.well_count_x, self.well_count_y)
+            self.geometry.homography = layout["homography"]
+
+        shape = layout["shape"]
+        fits = len(layout["counts"]) == self.coords.size // 2 and (
+            len(layout["pixels"]) == 0 or int(layout["pixels"].max()) < shape[0] * shape[1]
+        )
+        if fits:
+            self.mask.restore(
+                layout["pixels"], layout["labels"], layout["counts"], self.coords, self.radius, shape
+            )
+        else:
+            print("saved masks don't fit the layout, rebuilding")
+        if self.frames.shape is not None and tuple(self.frames.shape) != shape:
+            print(f"frames are {self.frames.shape}, layout was saved for {shape}, rebuilding masks")
+        # only builds when the restored masks don't match
+        self.calculate_mask()
+
+        self.camera_settings.update(layout["camera"])
+        return layout
+
+    def _to_celsius(self, values, frame, offset=True):
+        # raw frames are uint16 counts, everything reported to the user is in degrees C
+        if frame.dtype != np.uint16:
+            return values
+        if offset:
+            return values * Camera.SCALE + Camera.OFFSET
+        return values * Camera.SCALE
 
     def probe(self, x, y):
-        return self.data[y, x]
-
-    def _convert(self, frame: np.ndarray) -> str:
-        _, imencode_image = cv2.imencode(".jpg", frame)
-        return base64.b64encode(imencode_image.tobytes()).decode("ASCII")
+        data = self.data
+        if self.roi is not None:
+            x, y = np.round(to_frame((x, y), self.roi)).astype(int)
+            if not (0 <= y < data.shape[0] and 0 <= x < data.shape[1]):
+                return None
+        return self._to_celsius(data[y, x], data)
 
     def save_image(self, filename):
         frame = cv2.normalize(self.data, None, 0, 255, cv2.NORM_MINMAX, cv2.CV_8U)
@@ -262,75 +598,214 @@ class DataController:
         black_1px = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAAAXNSR0IArs4c6QAAAA1JREFUGFdjYGBg+A8AAQQBAHAgZQsAAAAASUVORK5CYII="
         placeholder = "data:image/jpg;base64," + black_1px
 
-        if self.video_capture is None:
-            return placeholder
-        self.data = self.video_capture.capture_data()
-        frame = cv2.normalize(self.data, None, 0, 255, cv2.NORM_MINMAX, cv2.CV_8U)
-        frame = cv2.applyColorMap(frame, cv2.COLORMAP_PLASMA)
-        if frame is None:
+        # colormapping and encoding happen on the preview thread,
+        # this only hands out the last encoded frame
+        if self.preview is None or self.preview.source is None:
             return placeholder
-        # `convert` is a CPU-intensive function, so we run it in a separate process to avoid blocking the event loop and GIL.
-        return "data:image/jpg;base64," + self._convert(frame)
-
-    def calculate_mask(self):
-        # for each center point
-        self.mask = []
-        print("calculating")
-        for _ in self.coords:
-            for value in _:
-                center_x = value[1]
-                center_y = value[0]
-
-                relevantCoords = []
-                # for each pixel check if its inside the radius of the current center point, if so save it to that masks entry
-                for x in range(480):
-                    for y in range(640):
-                        if (x - center_x) * (x - center_x) + (y - center_y) * (
-                            y - center_y
-                        ) < self.radius * self.radius:
-                            relevantCoords.append((x, y))
-                self.mask.append(relevantCoords)
+        return self.preview.source
+
+    def calculate_mask(self, shape=None, roi=None):
+        # all wells are built in one vectorized pass and cached,
+        # so this is only recalculated when coords, radius or frame shape change
+        roi = roi or self.roi
+        coords, radius = self.coords, self.radius
+        if roi is not None:
+            # coords are sensor pixels, the frames only cover the roi
+            coords, radius = to_frame(coords, roi), radius / roi.binning
+            shape = shape or frame_shape(roi)
+        shape = shape or self.frames.shape or (480, 640)
+        if self.mask.build(coords, radius, shape):
+            print("calculated mask")
+        self.journal.update(
+            layout={
+                "corners": np.asarray(self.corners, dtype=np.float64).tolist(),
+                "coords": np.asarray(self.coords, dtype=np.float64).tolist(),
+                "radius": float(self.radius),
+                "wells": [self.well_count_x, self.well_count_y],
+            }
+        )
         return True
 
-    def write(self, path, timestamp):
-        csvline = str(timestamp) + ","
-        # for each pixel in the mask average the values for each well
-        for well in self.mask:
-            sum = 0
-            for pixel in well:
-                sum += self.data[pixel[0]][pixel[1]]
-            avg = sum / len(well)
-            csvline += str(avg) + ","
-        csvline = csvline[:-1] + "\n"
-        with open(path, "a") as file:
-            file.write(csvline)
-
-    def create_file(self, file_name):
-        numbers_to_letters = {
-            0: "A",
-            1: "B",
-            2: "C",
-            3: "D",
-            4: "E",
-            5: "F",
-            6: "G",
-            7: "H",
-        }
-        with open(file_name, "w") as file:
-            csv_line = "Timestamp,"
-            for i in range(self.well_count_x):
-                for j in range(self.well_count_y):
-                    csv_line = csv_line + f"{i + 1}{numbers_to_letters[j]},"
-            file.write(csv_line + "\n")
+    def _sibling_path(self, path, suffix):
+        root, ext = os.path.splitext(path)
+        return root + "_" + suffix + (ext or ".csv")
+
+    def _stats_path(self, path):
+        return self._sibling_path(path, "stats")
+
+    def start_analysis(self, blank="8H", **params):
+        """
+        analyze every written row for peaks while capturing, params as for OnlinePeakAnalyzer
+        """
+        wells = self.well_names()
+        self.analyzer = OnlinePeakAnalyzer(wells, wells.index(blank), **params)
+        self.journal.update(analysis={"blank": blank, **params})
+
+    def stop_analysis(self):
+        self.analyzer = None
+        self.journal.update(analysis=None)
+
+    def write(self, path, timestamp=None, frame=None, block=False, capture_time=None):
+        """
+        write the well averages of frame (default the newest camera frame) to path
+        capture_time is the unix time the frame was taken, used by the live analysis
+        and as the row timestamp when timestamp is None
+        """
+        if frame is None:
+            latest = self.frames.latest()
+            if latest is None:
+                return
+            seq, capture_time, frame = latest
+            # acquired before the roi changed
+            if frame.shape != self.mask.shape:
+                return
+            # the camera hasn't sent a new frame since the last row of this file
+            if self.written_frames.get(path) == seq:
+                self.repeated_rows += 1
+            self.written_frames[path] = seq
+        # every well is averaged in one pass over the masked pixels
+        result = self.mask.reduce(frame, stats=self.write_stats)
+        stats = None
+        if self.write_stats:
+            means = self._to_celsius(result["mean"], frame)
+            stats = np.column_stack(
+                (
+                    self._to_celsius(result["min"], frame),
+                    self._to_celsius(result["max"], frame),
+                    self._to_celsius(result["std"], frame, offset=False),
+                    result["count"],
+                )
+            )
+        else:
+            means = self._to_celsius(result, frame)
+        self._write_row(path, timestamp, means, stats, block, capture_time)
+
+    def _write_row(self, path, timestamp, means, stats=None, block=False, capture_time=None):
+        if timestamp is None:
+            timestamp = datetime.fromtimestamp(capture_time or time.time()).time()
+        if stats is not None:
+            self.log_writer.write(
+                self._stats_path(path),
+                f"{timestamp}," + ",".join(map(str, stats.ravel().tolist())),
+                block,
+            )
+        self.log_writer.write(
+            path, f"{timestamp}," + ",".join(map(str, means.tolist())), block
+        )
+        if self.analyzer is not None:
+            completed = self.analyzer.update(capture_time or time.time(), means)
+            for peak in completed:
+                print(f"peak {peak['well']} cycle {peak['cycle']}: {peak['integral']:.2f}")
+
+    def _reduce_frame(self, frame):
+        # well means of one frame in degrees C, None for frames the masks weren't built for
+        if frame.shape != self.mask.shape:
+            return None
+        return self._to_celsius(self.mask.reduce(frame), frame)
+
+    def _write_accumulated(self, path, capture_time, result):
+        stats = None
+        if self.write_stats:
+            stats = np.column_stack((result["min"], result["max"], result["std"], result["count"]))
+        self._write_row(path, None, result["mean"], stats, capture_time=capture_time)
+
+    def start_capture(self, path, interval=1, mode="mean"):
+        """
+        write the wells to path every interval seconds without the UI timer
+
+        mode "frame" samples the newest frame, "mean", "median" and "reject"
+        reduce every frame acquired in between (see WellAccumulator), and
+        interval 0 writes each frame. Averaged rows go in the stats file with
+        min, max and std over the frames and the number of frames averaged,
+        so path has to be created with the same mode, see create_file.
+        """
+        if mode == "frame":
+            if interval <= 0:
+                raise ValueError("sampling frames needs an interval above 0")
+            self.capture_thread = PeriodicThread(interval, lambda: self.write(path))
+            self.capture_thread.start()
+        else:
+            self.accumulator = WellAccumulator(
+                self._reduce_frame,
+                lambda capture_time, result: self._write_accumulated(path, capture_time, result),
+                interval,
+                mode,
+            )
+            self.acquisition_thread.listeners.append(self.accumulator.push)
+        self.journal.update(
+            stage="capture", capture={"file": path, "interval": interval, "mode": mode}
+        )
+
+    def stop_capture(self):
+        if self.capture_thread is not None:
+            self._stop_thread(self.capture_thread)
+            self.capture_thread = None
+            self.journal.update(capture=None)
+        if self.accumulator is not None:
+            if self.accumulator.push in self.acquisition_thread.listeners:
+                self.acquisition_thread.listeners.remove(self.accumulator.push)
+            # the frames since the last row are written as a shorter row
+            self.accumulator.flush()
+            self.accumulator = None
+            self.journal.update(capture=None)
+
+    def frame_counters(self):
+        """
+        frames acquired, dropped, skipped by pacing below the camera's rate,
+        incomplete and duplicated by the camera, rows written again from a
+        frame already written and the age of the newest frame in seconds
+        """
+        counters = {"frames": 0, "dropped": 0, "skipped": 0, "incomplete": 0, "duplicated": 0, "errors": 0}
+        if self.acquisition_thread is not None:
+            counters = self.acquisition_thread.counters()
+        latest = self.frames.latest()
+        counters["repeated_rows"] = self.repeated_rows
+        counters["age"] = None if latest is None else time.time() - latest[1]
+        return counters
+
+    def well_names(self):
+        """
+        well names in the order they are written
+        """
+        return self.plate_format.well_names()
+
+    def create_file(self, file_name, mode="mean"):
+        """
+        start the capture csv and its logs, mode is the start_capture mode the
+        rows will be written with, which the stats columns depend on
+        """
+        wells = self.well_names()
+        self.log_writer.create(file_name, "Timestamp," + "".join(well + "," for well in wells))
+        if self.write_stats:
+            csv_line = "Timestamp"
+            for well in wells:
+                if mode == "frame":
+                    # over the pixels of the well in one frame
+                    csv_line += f",{well}_min,{well}_max,{well}_std,{well}_n"
+                else:
+                    # over the frames averaged into the row
+                    csv_line += f",{well}_{mode}_min,{well}_{mode}_max,{well}_{mode}_std,{well}_{mode}_frames"
+            self.log_writer.create(self._stats_path(file_name), csv_line)
+        # camera setting changes during the capture, with the settings it starts with
+        self.camera_settings.start_log(self._sibling_path(file_name, "settings"))
 
     def cleanup(self):
-        self._stop_thread(self.read_thread)
-        self._stop_thread(self.dose_thread)
-        self.dose_thread.join()
-        self.read_thread.join()
-        self.arduino.close()
-        if self.video_capture is not None:
-            self.video_capture.cleanup()
+        # shutting down mid run should be resumable like a crash
+        self.journal.freeze()
+        try:
+            self.stop_queue()
+            self.stop_reading()
+            self.stop_dose()
+            if self.video_capture is not None:
+                self.stop_recording()
+                self._stop_thread(self.preview)
+                self._stop_thread(self.acquisition_thread)
+                self.video_capture.cleanup()
+        finally:
+            if self.serial_loop is not None:
+                self.serial_loop.close()
+            # flush and fsync everything that is still queued
+            self._stop_thread(self.log_writer)
 
 
 if __name__ == "__main__":
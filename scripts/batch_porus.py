@@ -0,0 +1,179 @@
+from gasporosity.scripts.calculate_porus import (
+    analyze,
+    build_figure,
+    capture_wells,
+    load_capture,
+    normalize_wells,
+)
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+import argparse
+import hashlib
+import json
+import glob
+import os
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_key(path, params):
+    """
+    same file content and same analysis parameters give the same key
+    """
+    key = file_hash(path) + json.dumps(params, sort_keys=True)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def analyze_block(path, wells, params, figure=None):
+    """
+    analyze the given wells of one capture, wells None means all of them
+    optionally writes the figure of those wells to the html file figure
+    """
+    normalize = params["normalize"]
+    columns = None if wells is None else list(dict.fromkeys(wells + [normalize]))
+    data = load_capture(path, wells=columns)
+    results = analyze(data, **params)
+    if wells is not None:
+        results = results[results["well"].isin(wells)]
+    if figure is not None:
+        names, normalized = normalize_wells(data, normalize)
+        build_figure(data, normalized, names, results, fast=True).write_html(figure)
+    return results
+
+
+def figure_paths(out, name, count):
+    """
+    html figure of each of the count blocks of capture name
+    """
+    if count == 1:
+        return [os.path.join(out, f"{name}.html")]
+    return [os.path.join(out, f"{name}_{i}.html") for i in range(count)]
+
+
+def batch(paths, out="out", params=None, block=None, workers=None, figures=False, force=False):
+    """
+    analyze every capture in paths on a process pool, skipping captures whose
+    content and parameters match a cached result
+
+    writes <out>/<name>_results.csv per capture and returns {path: results}
+    """
+    params = params or {}
+    params.setdefault("normalize", "8H")
+    cache = os.path.join(out, ".cache")
+    os.makedirs(cache, exist_ok=True)
+
+    done = {}
+    tasks = {}
+    for path in paths:
+        key = cache_key(path, params)
+        cached = os.path.join(cache, key + ".csv")
+        name = os.path.splitext(os.path.basename(path))[0]
+        try:
+            wells = capture_wells(path)
+        except Exception as e:
+            print(f"failed  {path}: {e}")
+            continue
+        if block:
+            blocks = [wells[i : i + block] for i in range(0, len(wells), block)]
+        else:
+            blocks = [None]
+        figure_files = figure_paths(out, name, len(blocks)) if figures else [None] * len(blocks)
+        # figures aren't cached, a cached capture is analyzed again when one is missing
+        missing = any(figure is not None and not os.path.exists(figure) for figure in figure_files)
+        if not force and not missing and os.path.exists(cached):
+            print(f"cached  {path}")
+            done[path] = pd.read_csv(cached)
+            continue
+        tasks[path] = (name, cached, list(zip(blocks, figure_files)))
+
+    with ProcessPoolExecutor(workers) as pool:
+        futures = {}
+        for path, (name, _, blocks) in tasks.items():
+            for wells, figure in blocks:
+                futures[pool.submit(analyze_block, path, wells, params, figure)] = path
+
+        parts = {path: [] for path in tasks}
+        failed = set()
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                parts[path].append(future.result())
+            except Exception as e:
+                print(f"failed  {path}: {e}")
+                failed.add(path)
+
+    for path, (name, cached, _) in tasks.items():
+        if path in failed:
+            continue
+        results = pd.concat(parts[path], ignore_index=True)
+        results.to_csv(cached, index=False)
+        print(f"done    {path}")
+        done[path] = results
+
+    for path, results in done.items():
+        name = os.path.splitext(os.path.basename(path))[0]
+        results.to_csv(os.path.join(out, f"{name}_results.csv"), index=False)
+    return done
+
+
+# logs written next to a capture, see DataController._sibling_path and the dose log
+SIBLING_SUFFIXES = ("_stats", "_settings", "_doses")
+
+
+def is_capture(path):
+    """
+    a capture csv starts with a Timestamp header, pressure logs have no header
+    and the logs written next to a capture are told apart by their suffix
+    """
+    root, ext = os.path.splitext(os.path.basename(path))
+    if ext != ".csv" or root.endswith(SIBLING_SUFFIXES):
+        return False
+    with open(path, errors="replace") as file:
+        return file.readline().startswith("Timestamp,")
+
+
+def capture_files(directory="data"):
+    return sorted(
+        path
+        for path in glob.glob(os.path.join(directory, "*.csv"))
+        if os.path.isfile(path) and is_capture(path)
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="analyze capture csvs in parallel")
+    parser.add_argument("paths", nargs="*", help="capture files, default the capture csvs in data/")
+    parser.add_argument("--out", default="out")
+    parser.add_argument("--normalize", default="8H", help="blank well")
+    parser.add_argument("--height", type=float, default=0.25)
+    parser.add_argument("--distance", type=int, default=200)
+    parser.add_argument("--before", type=int, default=30)
+    parser.add_argument("--after", type=int, default=300)
+    parser.add_argument("--block", type=int, help="wells per task instead of one task per file")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--figures", action="store_true", help="write html figures to --out")
+    parser.add_argument("--force", action="store_true", help="ignore cached results")
+    args = parser.parse_args()
+
+    params = {
+        "normalize": args.normalize,
+        "height": args.height,
+        "distance": args.distance,
+        "before": args.before,
+        "after": args.after,
+    }
+    batch(
+        args.paths or capture_files(),
+        args.out,
+        params,
+        block=args.block,
+        workers=args.workers,
+        figures=args.figures,
+        force=args.force,
+    )
@@ -0,0 +1,178 @@
+from gasporosity.classes.mask import WellMask
+from gasporosity.classes.synthetic_camera import SyntheticCamera
+from gasporosity.classes.preview import PreviewEncoder
+from gasporosity.data_controller import DataController
+from gasporosity.classes.plate_format import PLATE_FORMATS
+from gasporosity.scripts.calculate_porus import calculate_porus
+from datetime import datetime, timedelta
+import numpy as np
+import tempfile
+import tracemalloc
+import time
+import os
+import sys
+
+LAYOUTS = [int(name) for name in PLATE_FORMATS]
+
+
+def plate_coords(well_count_x, well_count_y, shape=(480, 640)):
+    """
+    evenly spaced well centers covering most of the frame, laid out like DataController.coords
+    """
+    xs = np.linspace(0.05 * shape[1], 0.95 * shape[1], well_count_x)
+    ys = np.linspace(0.05 * shape[0], 0.95 * shape[0], well_count_y)
+    return np.stack(np.meshgrid(xs, ys, indexing="ij"), axis=-1)
+
+
+def benchmark_reduce(well_count_x=24, well_count_y=16, radius=6, rate=60, seconds=10):
+    shape = (480, 640)
+    mask = WellMask()
+    mask.build(plate_coords(well_count_x, well_count_y, shape), radius, shape)
+    frame = 20 + np.random.default_rng(0).normal(0, 0.1, shape)
+
+    iterations = rate * seconds
+    start = time.perf_counter()
+    for _ in range(iterations):
+        result = mask.reduce(frame, stats=True)
+        ",".join(map(str, result["mean"].tolist()))
+    elapsed = (time.perf_counter() - start) / iterations
+
+    print(f"{len(mask)} wells, {mask.pixels.size} pixels")
+    print(f"reduce + format: {elapsed * 1000:.3f} ms per frame ({1 / elapsed:.0f} Hz)")
+    print(f"{rate} Hz budget: {1000 / rate:.3f} ms -> {'OK' if elapsed < 1 / rate else 'TOO SLOW'}")
+
+
+def check_raw_stats(well_count_x=12, well_count_y=8, radius=6):
+    """
+    reduce(stats=True) on raw uint16 counts has to agree with the same frame as floats
+    """
+    shape = (480, 640)
+    mask = WellMask()
+    mask.build(plate_coords(well_count_x, well_count_y, shape), radius, shape)
+    frame = np.random.default_rng(0).integers(29000, 31000, shape, dtype=np.uint16)
+    raw = mask.reduce(frame, stats=True)
+    expected = mask.reduce(frame.astype(np.float64), stats=True)
+    matches = all(np.allclose(raw[key], expected[key]) for key in ("mean", "min", "max", "std"))
+    print(f"raw uint16 stats: {'OK' if matches else 'MISMATCH'}")
+    return matches
+
+
+def layout_controller(wells, shape=(480, 640)):
+    """
+    a DataController with a plate of `wells` wells clicked in, and a synthetic camera for it
+    """
+    controller = DataController(journal_path=os.path.join(tempfile.mkdtemp(), "journal.json"))
+    controller.set_plate_format(str(wells))
+    well_count_x = controller.well_count_x
+    corners = plate_coords(2, 2, shape).reshape(-1, 2)
+    for x, y in corners:
+        controller.edit_corners(x, y)
+    pitch = (corners[-1][0] - corners[0][0]) / (well_count_x - 1)
+    controller.radius = 0.35 * pitch
+    camera = SyntheticCamera(
+        shape, controller.coords, controller.radius, fps=30, realtime=False
+    )
+    return controller, camera
+
+
+def time_stage(function, iterations):
+    samples = np.empty(iterations)
+    for i in range(iterations):
+        start = time.perf_counter()
+        function()
+        samples[i] = time.perf_counter() - start
+    return samples
+
+
+def peak_memory(function, iterations=3):
+    tracemalloc.start()
+    for _ in range(iterations):
+        function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def write_capture(controller, camera, path, seconds, rate=1):
+    """
+    write a capture csv like the UI does, sampling the synthetic camera at rate Hz
+    """
+    names = controller.well_names()
+    step = int(camera.fps / rate)
+    start = datetime(2000, 1, 1, 10)
+    with open(path, "w") as file:
+        file.write("Timestamp," + ",".join(names) + "\n")
+        for sample in range(int(seconds * rate)):
+            camera.frame_index = sample * step
+            means = controller.mask.reduce(camera.capture_data())
+            timestamp = (start + timedelta(seconds=sample / rate)).strftime("%H:%M:%S.%f")
+            file.write(f"{timestamp}," + ",".join(map(str, means.tolist())) + "\n")
+    return names[-1]
+
+
+def report(name, samples, memory):
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99]) * 1000
+    print(
+        f"  {name:<15}{p50:>10.3f}{p95:>10.3f}{p99:>10.3f}{1 / np.mean(samples):>12.1f}{memory / 1e6:>10.2f}"
+    )
+
+
+def run_layout(wells, iterations=200, seconds=5, capture_seconds=1200, analysis=True):
+    controller, camera = layout_controller(wells)
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "Temperature.csv")
+    shape = camera.shape
+    frame = camera.capture_data()
+    encoder = PreviewEncoder(controller.frames)
+    timestamp = datetime.now().time()
+
+    def calculate_mask():
+        # what calculate_mask does, without the cache
+        controller.mask.invalidate()
+        controller.mask.build(controller.coords, controller.radius, shape)
+
+    calculate_mask()
+    stages = {
+        "capture": camera.capture_data,
+        "calculate_mask": calculate_mask,
+        "write": lambda: controller.write(path, timestamp, frame),
+        "get_frame": lambda: encoder.encode(frame),
+    }
+
+    print(f"{wells} wells ({len(controller.mask)} masks, {controller.mask.pixels.size} pixels)")
+    print(f"  {'stage':<15}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'per s':>12}{'peak MB':>10}")
+    for name, function in stages.items():
+        report(name, time_stage(function, iterations), peak_memory(function))
+
+    # capture -> publish -> write for every frame, as fast as it goes
+    frames = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        data = camera.capture_data()
+        controller.frames.publish(data, time.time())
+        controller.write(path, timestamp)
+        frames += 1
+    print(f"  pipeline: {frames / (time.perf_counter() - start):.1f} frames per second")
+
+    if analysis:
+        csv = os.path.join(directory, "capture.csv")
+        blank = write_capture(controller, camera, csv, capture_seconds)
+        function = lambda: calculate_porus(csv, normalize=blank, show=False)
+        report("calculate_porus", time_stage(function, 1), peak_memory(function, 1))
+
+    controller._stop_thread(controller.log_writer)
+
+
+def run_suite(layouts=LAYOUTS, analysis=True):
+    check_raw_stats()
+    for wells in layouts:
+        run_layout(wells, analysis=analysis)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "reduce":
+        benchmark_reduce(*[int(arg) for arg in sys.argv[2:]])
+    else:
+        # benchmark.py [wells ...] [--no-analysis]
+        layouts = [int(arg) for arg in sys.argv[1:] if arg != "--no-analysis"]
+        run_suite(layouts or LAYOUTS, analysis="--no-analysis" not in sys.argv)
@@ -2,63 +2,225 @@ from scipy import signal, integrate
 import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
-import datetime
+import os
 import sys
 
 
-def calculate_porus(csv, normalize="8H"):
-    data = pd.read_csv(csv)
-    fig = go.Figure()
-    n_peaks_dict = {}
-    magnitude_dict = {}
-    integral_dict = {}
-    first_time = datetime.datetime.strptime(data["Timestamp"][0], "%H:%M:%S.%f")
-    data["Timestamp"] = data["Timestamp"].apply(
-        lambda x: (datetime.datetime.strptime(x, "%H:%M:%S.%f")-first_time).total_seconds())
-    for column in data.columns:
-        if column == "Timestamp":
-            continue
-        normalized = data[column] - data[normalize]
-        normalized = normalized + abs(min(normalized))
-        fig.add_trace(
-            go.Scatter(
-                x=data["Timestamp"],
-                y=normalized,
-                mode="lines",
-                name=column,
+def elapsed_seconds(timestamps, time_format="%H:%M:%S.%f"):
+    """
+    seconds since the first sample, timestamps are either numeric epoch seconds
+    or time of day strings in time_format, which may wrap around midnight
+    """
+    if pd.api.types.is_numeric_dtype(timestamps):
+        seconds = timestamps.to_numpy(np.float64)
+        return seconds - seconds[0]
+
+    times = pd.to_datetime(timestamps, format=time_format, errors="coerce")
+    missing = times.isna()
+    if missing.any() and time_format.endswith(".%f"):
+        # str(datetime.time) leaves out the fraction on whole seconds
+        times[missing] = pd.to_datetime(timestamps[missing], format=time_format[:-3])
+    seconds = (times - times.dt.normalize()).dt.total_seconds().to_numpy()
+    # a time of day going backwards by more than half a day means we crossed midnight
+    days = np.concatenate(([0], np.cumsum(np.diff(seconds) < -43200)))
+    seconds = seconds + days * 86400
+    return seconds - seconds[0]
+
+
+def capture_wells(csv):
+    """
+    well column names of a capture csv
+    """
+    columns = pd.read_csv(csv, nrows=0).columns
+    # the header has a trailing comma, which shows up as an empty unnamed column
+    return [column for column in columns if column != "Timestamp" and not column.startswith("Unnamed")]
+
+
+def load_capture(csv, time_format="%H:%M:%S.%f", wells=None):
+    """
+    load a capture csv with float32 well columns and Timestamp as seconds since the start
+    wells limits loading to those columns
+    """
+    if wells is None:
+        wells = capture_wells(csv)
+    data = pd.read_csv(
+        csv,
+        usecols=["Timestamp"] + wells,
+        dtype={well: np.float32 for well in wells},
+    )
+    data["Timestamp"] = elapsed_seconds(data["Timestamp"], time_format)
+    return data
+
+
+def normalize_wells(data, normalize="8H"):
+    """
+    subtract the blank well from every well at once and shift each well so it starts at 0
+    returns the well names and the (time, well) matrix
+    """
+    wells = [column for column in data.columns if column != "Timestamp"]
+    normalized = data[wells].to_numpy(np.float64) - data[normalize].to_numpy(np.float64)[:, None]
+    normalized += np.abs(normalized.min(axis=0))
+    return wells, normalized
+
+
+def analyze(data, normalize="8H", height=0.25, distance=200, before=30, after=300):
+    """
+    find the adsorption peaks of every well and integrate them
+    over the samples peak - before to peak + after
+
+    returns a table with one row per well per cycle:
+    well, cycle, peak (sample index), time, magnitude, integral
+    """
+    wells, normalized = normalize_wells(data, normalize)
+    timestamps = data["Timestamp"].to_numpy(np.float64)
+    # integrals of any window are a difference of two entries of the running integral
+    cumulative = integrate.cumulative_trapezoid(normalized, timestamps, axis=0, initial=0)
+
+    peak_index = []
+    well_index = []
+    cycles = []
+    for k in range(len(wells)):
+        peaks = signal.find_peaks(normalized[:, k], height=height, distance=distance)[0]
+        peak_index.append(peaks)
+        well_index.append(np.full(len(peaks), k))
+        cycles.append(np.arange(1, len(peaks) + 1))
+    peak_index = np.concatenate(peak_index).astype(np.intp)
+    well_index = np.concatenate(well_index).astype(np.intp)
+
+    start = np.clip(peak_index - before, 0, len(timestamps) - 1)
+    end = np.clip(peak_index + after, 1, len(timestamps)) - 1
+    integrals = cumulative[end, well_index] - cumulative[start, well_index]
+
+    return pd.DataFrame(
+        {
+            "well": np.asarray(wells, dtype=object)[well_index],
+            "cycle": np.concatenate(cycles).astype(int),
+            "peak": peak_index,
+            "time": timestamps[peak_index],
+            "magnitude": normalized[peak_index, well_index],
+            "integral": integrals,
+        }
+    )
+
+
+def decimate(normalized, buckets):
+    """
+    min/max bucket downsampling of every well at once, keeps the first and last
+    sample and the lowest and highest sample of each bucket so peaks survive
+    returns the kept sample indices per well, shape (samples kept, wells)
+    """
+    n = len(normalized)
+    size = -(-n // buckets)
+    padded = np.pad(normalized, ((0, size * buckets - n), (0, 0)), mode="edge")
+    padded = padded.reshape(buckets, size, -1)
+    offsets = np.arange(buckets)[:, None] * size
+    low = padded.argmin(axis=1) + offsets
+    high = padded.argmax(axis=1) + offsets
+    ends = np.array([[0], [n - 1]]).repeat(normalized.shape[1], axis=1)
+    indices = np.sort(np.concatenate((ends, low, high)), axis=0)
+    return np.minimum(indices, n - 1)
+
+
+def build_figure(data, normalized, wells, results, fast=False, max_points=2000):
+    """
+    plotly figure of every normalized well with its peaks and integrals marked
+
+    fast draws with WebGL, downsamples every well to about max_points samples
+    and puts all peaks and their integrals into a single trace
+    """
+    if not fast:
+        fig = go.Figure()
+        for k, well in enumerate(wells):
+            fig.add_trace(
+                go.Scatter(
+                    x=data["Timestamp"],
+                    y=normalized[:, k],
+                    mode="lines",
+                    name=well,
+                )
             )
-        )
-        peaks = signal.find_peaks(normalized, height=0.25, distance=200)[0]
-        
-        if len(peaks) == 0:
-            print(f"No peaks found for {column}")
-            continue
-        integrals = []
-        for peak in peaks:
-            integrals.append(integrate.trapezoid(normalized[peak-30:peak+300],data["Timestamp"][peak-30:peak + 300]))
-            #minus the square
-            fig.add_annotation(text=f"{integrals[-1]:.2f}",x=data["Timestamp"][peak],y=normalized[peak], showarrow=True)
-        
-        n_peaks_dict[column] = len(peaks)
-        integral_dict[column] = integrals
-        magnitude_dict[column] = sum([normalized[i] for i in peaks])
-        fig.add_trace(
-            go.Scatter(
-                x=[data["Timestamp"][peak] for peak in peaks],
-                y=[normalized[i] for i in peaks],
-                mode="markers",
-                marker=dict(size=8, color="red", symbol="cross"),
-                name=f"{column} peaks",
+            peaks = results[results["well"] == well]
+            if len(peaks) == 0:
+                continue
+            for peak in peaks.itertuples():
+                fig.add_annotation(text=f"{peak.integral:.2f}", x=peak.time, y=peak.magnitude, showarrow=True)
+            fig.add_trace(
+                go.Scatter(
+                    x=peaks["time"],
+                    y=peaks["magnitude"],
+                    mode="markers",
+                    marker=dict(size=8, color="red", symbol="cross"),
+                    name=f"{well} peaks",
+                )
             )
+        return fig
+
+    timestamps = data["Timestamp"].to_numpy()
+    if len(timestamps) > max_points:
+        indices = decimate(normalized, max_points // 2)
+    else:
+        indices = np.arange(len(timestamps))[:, None].repeat(len(wells), axis=1)
+    traces = [
+        go.Scattergl(
+            x=timestamps[indices[:, k]],
+            y=normalized[indices[:, k], k],
+            mode="lines",
+            name=well,
+        )
+        for k, well in enumerate(wells)
+    ]
+    traces.append(
+        go.Scattergl(
+            x=results["time"],
+            y=results["magnitude"],
+            mode="markers+text",
+            text=[f"{integral:.2f}" for integral in results["integral"]],
+            textposition="top center",
+            hovertext=results["well"],
+            marker=dict(size=8, color="red", symbol="cross"),
+            name="peaks",
         )
-        
-    fig.show()
-    print(n_peaks_dict)
-    print(integral_dict)
+    )
+    return go.Figure(data=traces)
+
+
+def calculate_porus(csv, normalize="8H", show=True, out=None, fast=True):
+    """
+    analyze a capture, show=True opens the figure in the browser,
+    out writes it as a self-contained html file into that directory instead
+    """
+    data = load_capture(csv)
+    results = analyze(data, normalize)
+    grouped = results.groupby("well", sort=False)
+    n_peaks_dict = grouped.size().to_dict()
+    magnitude_dict = grouped["magnitude"].sum().to_dict()
+    integral_dict = grouped["integral"].apply(list).to_dict()
+    for column in data.columns[1:]:
+        if column not in n_peaks_dict:
+            print(f"No peaks found for {column}")
 
-   
+    if show or out is not None:
+        wells, normalized = normalize_wells(data, normalize)
+        fig = build_figure(data, normalized, wells, results, fast=fast)
+        if out is not None:
+            name = os.path.splitext(os.path.basename(csv))[0]
+            path = os.path.join(out, name + ".html")
+            fig.write_html(path, include_plotlyjs=True)
+            print(f"figure written to {path}")
+        else:
+            fig.show()
+        print(n_peaks_dict)
+        print(integral_dict)
+    return results
 
 
 if __name__ == "__main__":
-    calculate_porus("data/Megan_0807_T",normalize="8H")
-    #calculate_porus(str(sys.argv[1]),str(sys.argv[2]))
+    # calculate_porus.py [capture] [blank] [--show] [--full]
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    calculate_porus(
+        args[0] if args else "data/Megan_0807_T",
+        normalize=args[1] if len(args) > 1 else "8H",
+        show="--show" in sys.argv,
+        out=None if "--show" in sys.argv else "out",
+        fast="--full" not in sys.argv,
+    )
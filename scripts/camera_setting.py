@@ -0,0 +1,40 @@
+from gasporosity.classes.camera_settings import SETTERS
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+import json
+import sys
+
+
+def change_setting(name, value, url="http://127.0.0.1:8080"):
+    """
+    change a camera setting through the running UI, which applies it to the open
+    camera and logs it, only opens the camera itself when the UI isn't running
+    raises ValueError when the UI refuses the setting
+    """
+    try:
+        request = Request(f"{url}/api/camera/{name}?value={value}", method="POST")
+        with urlopen(request, timeout=5) as response:
+            return json.load(response)
+    except HTTPError as e:
+        # the UI is running and has the camera, it just refused the setting
+        try:
+            detail = json.load(e)["detail"]
+        except (ValueError, KeyError):
+            detail = e.reason
+        raise ValueError(f"the UI rejected {name}={value}: {e.code} {detail}") from e
+    except URLError:
+        pass
+    # only needs PySpin when the UI isn't holding the camera
+    from gasporosity.classes.camera import FlirCamera
+
+    camera = FlirCamera()
+    try:
+        getattr(camera, SETTERS[name])(value)
+    finally:
+        camera.cleanup()
+    return {name: value}
+
+
+if __name__ == "__main__":
+    # camera_setting.py <emissivity|distance|reflected_temperature|focus> <value>
+    print(change_setting(sys.argv[1], float(sys.argv[2])))
@@ -1,10 +1,8 @@
-from gasporosity.classes.camera import FlirCamera
+from gasporosity.scripts.camera_setting import change_setting
 import sys
 
 def change_distance(distance):
-    camera = FlirCamera()
-    camera.set_emissivity(distance)
-    camera.cleanup()
+    change_setting("distance", distance)
 
 
 if __name__ == "__main__":
@@ -1,10 +1,8 @@
-from gasporosity.classes.camera import FlirCamera
+from gasporosity.scripts.camera_setting import change_setting
 import sys
 
 def change_emissivity(emissivity):
-    camera = FlirCamera()
-    camera.set_emissivity(emissivity)
-    camera.cleanup()
+    change_setting("emissivity", emissivity)
 
 
 if __name__ == "__main__":
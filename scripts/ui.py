@@ -1,9 +1,11 @@
 from nicegui import ui, app, core, Client, events
+from fastapi import HTTPException
 from gasporosity.data_controller import DataController
 import signal
-from datetime import datetime
+from datetime import datetime, timedelta
 import threading
 import time
+import numpy as np
 
 
 class State:
@@ -28,6 +30,9 @@ def start_data_capture():
     calculates mask then starts the data capture
     """
     global btn_start_data
+    if capture_mode.value == "frame" and not capture_interval.value:
+        ui.notify("sampling single frames needs a row interval above 0")
+        return
     btn_start_data.disable()
     controller.radius = slider.value
     mask_thread = threading.Thread(target=calculate_mask, daemon=True)
@@ -39,15 +44,32 @@ def calculate_mask():
     global btn_stop_data
     controller.calculate_mask()
     global temp_file_name
-    controller.create_file(temp_file_name.text)
+    controller.create_file(temp_file_name.text, capture_mode.value)
+    try:
+        controller.start_analysis(blank_well.value)
+        analysis_updater.activate()
+    except ValueError:
+        print(f"blank well {blank_well.value} not on the plate, live analysis off")
+    controller.start_capture(temp_file_name.text, capture_interval.value or 0, capture_mode.value)
     btn_stop_data.enable()
-    writer.activate()
 
 
 def stop_data_capture():
     btn_start_data.enable()
     btn_stop_data.disable()
-    writer.deactivate()
+    controller.stop_capture()
+    analysis_updater.deactivate()
+    controller.stop_analysis()
+
+
+def update_analysis():
+    """
+    shows the live peak integrals of every well
+    """
+    if controller.analyzer is None:
+        return
+    analysis_table.rows = controller.analyzer.summary()
+    analysis_table.update()
 
 
 def start_camera():
@@ -59,6 +81,9 @@ def start_camera():
         btn_start_camera.disable()
         btn_corners.enable()
         btn_wells.enable()
+        btn_detect.enable()
+        btn_roi.enable()
+        btn_full.enable()
         btn_probe.enable()
         btn_focus.enable()
         btn_save.enable()
@@ -66,6 +91,90 @@ def start_camera():
         ui.notify(e)
 
 
+def save_layout(name):
+    if len(controller.coords) == 0:
+        ui.notify("set the wells first")
+        return
+    # the masks are built with the radius on the slider
+    controller.radius = slider.value
+    path = controller.save_layout(name)
+    ui.notify(f"saved {path}")
+
+
+def load_layout(name):
+    try:
+        controller.load_layout(name)
+    except (OSError, ValueError, KeyError) as e:
+        ui.notify(f"could not load layout: {e}")
+        return
+    slider.value = controller.radius
+    # the counts match the loaded layout already, so the slider handlers keep its coords
+    slider_x_wells.value = controller.well_count_x
+    slider_y_wells.value = controller.well_count_y
+    name = controller.plate_format.name
+    plate_format.value = name if name in plate_format.options else "custom"
+    settings = controller.camera_settings.values
+    emissivity.value = settings.get("emissivity")
+    distance.value = settings.get("distance")
+    reflected_temperature.value = settings.get("reflected_temperature")
+    focus_position.value = settings.get("focus")
+    btn_start_data.enable()
+    ui.notify(f"loaded {name}")
+
+
+def set_plate_format(name):
+    if name == "custom":
+        return
+    controller.set_plate_format(name)
+    slider_x_wells.value = controller.well_count_x
+    slider_y_wells.value = controller.well_count_y
+
+
+def set_well_count(x=None, y=None):
+    controller.set_well_count(x=x, y=y)
+    name = controller.plate_format.name
+    plate_format.value = name if name in plate_format.options else "custom"
+
+
+def crop_to_plate():
+    if len(controller.coords) == 0:
+        ui.notify("set the wells first")
+        return
+    controller.radius = slider.value
+    try:
+        roi = controller.set_roi(binning=int(binning.value))
+    except NotImplementedError as e:
+        ui.notify(str(e))
+        return
+    ui.notify(f"acquiring {roi.width}x{roi.height} at {roi.x},{roi.y}, binning {roi.binning}")
+
+
+def apply_camera_settings():
+    values = {
+        "emissivity": emissivity.value,
+        "distance": distance.value,
+        "reflected_temperature": reflected_temperature.value,
+        "focus": focus_position.value,
+    }
+    for name, value in values.items():
+        if value is None or controller.camera_settings.values.get(name) == value:
+            continue
+        try:
+            controller.set_camera_setting(name, value)
+        except Exception as e:
+            ui.notify(f"could not set {name}: {e}")
+
+
+def detect_wells():
+    try:
+        radius = controller.detect_wells()
+    except ValueError as e:
+        ui.notify(str(e))
+        return
+    slider.value = round(radius, 1)
+    btn_start_data.enable()
+
+
 def mouse_handler(e: events.MouseEventArguments):
     """
     Depending on the state of the system,
@@ -135,7 +244,13 @@ def degas_timer_function(timenow):
 
 
 def dose():
-    controller.dose(number_of_cycles.value)
+    # one dwell for every cycle, or a comma separated dwell per cycle
+    dwell = [float(value) for value in dwell_times.value.split(",") if value.strip()]
+    controller.dose(
+        number_of_cycles.value,
+        dwell or None,
+        pres_file_name.text.replace(".csv", "_doses.csv"),
+    )
     cycle_updater.activate()
     auto_stop_timer.activate()
 
@@ -146,6 +261,93 @@ def dose_stop():
     cycle_updater.deactivate()
 
 
+def start_queue():
+    try:
+        controller.start_queue(recipe_file.value)
+    except (OSError, ValueError) as e:
+        ui.notify(f"could not start the queue: {e}")
+        return
+    btn_start_queue.disable()
+    btn_stop_queue.enable()
+    set_manual_controls(False)
+    queue_updater.activate()
+
+
+def set_manual_controls(enabled):
+    """
+    the run queue uses the Arduino, Phoenix and capture while it runs
+    """
+    if enabled:
+        btn_start_arduino.enable()
+        btn_degas.enable()
+        if len(controller.coords) > 0:
+            btn_start_data.enable()
+    else:
+        btn_start_arduino.disable()
+        btn_dose.disable()
+        btn_degas.disable()
+        btn_start_data.disable()
+        btn_resume.disable()
+
+
+def stop_queue():
+    controller.stop_queue()
+    update_queue()
+
+
+def resume_run():
+    global degas_start_time
+    resumed = controller.resume(line_plot)
+    btn_resume.disable()
+    ui.notify(f"resumed {', '.join(resumed) or 'nothing'}")
+    if "queue" in resumed:
+        btn_start_queue.disable()
+        btn_stop_queue.enable()
+        set_manual_controls(False)
+        queue_updater.activate()
+    if "reading" in resumed:
+        btn_start_arduino.disable()
+        btn_stop_arduino.enable()
+        btn_dose.enable()
+    if "dose" in resumed:
+        cycle_updater.activate()
+    if "capture" in resumed:
+        btn_start_data.disable()
+        btn_stop_data.enable()
+        if controller.analyzer is not None:
+            analysis_updater.activate()
+    if "degas" in resumed:
+        # the timer counts from the start of the profile, not from the resume
+        checkpoint = controller.journal.get("degas")
+        held = 0
+        if checkpoint is not None:
+            held = sum(seconds for _, seconds in checkpoint["profile"][: checkpoint["step"]])
+            held += checkpoint["elapsed"]
+        degas_start_time = datetime.now() - timedelta(seconds=held)
+        degas_timer.activate()
+
+
+def update_queue():
+    text_queue.set_text(controller.run_queue.status())
+    if not controller.run_queue.is_alive():
+        btn_start_queue.enable()
+        btn_stop_queue.disable()
+        set_manual_controls(True)
+        queue_updater.deactivate()
+
+
+def update_frame_counters():
+    counters = controller.frame_counters()
+    age = counters["age"]
+    text_frames.set_text(
+        f"Frames {counters['frames']}, dropped {counters['dropped']}, "
+        f"skipped by pacing {counters['skipped']}, "
+        f"incomplete {counters['incomplete']}, duplicated {counters['duplicated']}, "
+        f"repeated rows {counters['repeated_rows']}, "
+        + ("no frame yet" if age is None else f"newest frame {age * 1000:.0f} ms old")
+    )
+
+
 def update_cycle():
     cycle = controller.read_cycle()
     text_cycle.set_text(cycle)
@@ -170,33 +372,45 @@ def update_image():
     """
     get the frames and updates the video image
     """
-    video_image.set_source(controller.get_frame())
+    source = controller.get_frame()
+    # the encoded frame is shared, only send it when the preview thread made a new one
+    if source != video_image.source:
+        video_image.set_source(source)
     draw_circles()
 
 
 def draw_circles():
     """
-    draws the circles on the video image
+    draws the circles on the overlay layer of the video image,
+    only rebuilt when the wells, corners, radius or well counts change
     """
-    video_image.content = ""
-    numbers_to_letters = {
-        0: "A",
-        1: "B",
-        2: "C",
-        3: "D",
-        4: "E",
-        5: "F",
-        6: "G",
-        7: "H",
-    }
+    global overlay_key
+    key = (
+        np.asarray(controller.coords).tobytes(),
+        tuple(tuple(corner) for corner in controller.corners),
+        slider.value,
+        controller.well_count_x,
+        controller.well_count_y,
+    )
+    if key == overlay_key:
+        return
+    overlay_key = key
+
+    radius = slider.value
+    names = controller.well_names()
+    rows = controller.well_count_y
+    # smaller labels on dense plates so they stay inside their wells
+    font_size = max(6, min(10, radius))
+    parts = []
     for i, x in enumerate(controller.coords):
         for j, y in enumerate(x):
             color = "SkyBlue"
-            video_image.content += f'<circle cx="{y[0]}" cy="{y[1]}" r="{slider.value}" fill="none" stroke="{color}" stroke-width="3" />'
-            video_image.content += f'<text x={y[0] + slider.value} y={y[1] + slider.value} stroke="white" font-size="10">{i + 1}{numbers_to_letters[j]}</text>'
+            parts.append(f'<circle cx="{y[0]}" cy="{y[1]}" r="{radius}" fill="none" stroke="{color}" stroke-width="3" />')
+            parts.append(f'<text x={y[0] + radius} y={y[1] + radius} stroke="white" font-size="{font_size}">{names[i * rows + j]}</text>')
     for corner in controller.corners:
         color = "Green"
-        video_image.content += f'<circle cx="{corner[0]}" cy="{corner[1]}" r="{slider.value}" fill="none" stroke="{color}" stroke-width="3" />'
+        parts.append(f'<circle cx="{corner[0]}" cy="{corner[1]}" r="{radius}" fill="none" stroke="{color}" stroke-width="3" />')
+    overlay.content = "".join(parts)
 
 
 ############################# WEBSITE HANDLING THINGS ###############################
@@ -221,6 +435,25 @@ def handle_sigint(signum, frame) -> None:
     ui.timer(1, lambda: signal.default_int_handler(signum, frame), once=True)
 
 
+############################# LOCAL API ###############################
+@app.get("/api/camera")
+def get_camera_settings():
+    return controller.camera_settings.values
+
+
+@app.post("/api/camera/{name}")
+def post_camera_setting(name: str, value: float):
+    # applied to the open camera and logged like a change from the UI
+    try:
+        controller.set_camera_setting(name, value)
+    except KeyError as e:
+        raise HTTPException(404, e.args[0])
+    except Exception as e:
+        # the camera refused it, or doesn't have the setting
+        raise HTTPException(400, str(e) or type(e).__name__)
+    return controller.camera_settings.values
+
+
 ############################# ACTUAL UI STUFF #####################################
 app.on_shutdown(cleanup)
 signal.signal(signal.SIGINT, handle_sigint)
@@ -249,6 +482,7 @@ with ui.splitter() as splitter:
                     number_of_cycles = ui.select(
                         [1, 2, 3, 4, 5, 6, 7, 8, 9, 10], value=7
                     )
+                    dwell_times = ui.input(label="Dwell (s)", value="300")
                     btn_dose_stop = ui.button(
                         "stop cycling", on_click=lambda: dose_stop()
                     )
@@ -277,6 +511,19 @@ with ui.splitter() as splitter:
                         btn_cancel = ui.button(
                             "Cancel", on_click=lambda: degas_cancel()
                         )
+                        ui.label("Run Queue")
+                        recipe_file = ui.input(label="Recipe File", value="data/recipes.json")
+                        with ui.row():
+                            btn_start_queue = ui.button("Run", on_click=lambda: start_queue())
+                            btn_stop_queue = ui.button("Stop", on_click=lambda: stop_queue())
+                            btn_stop_queue.disable()
+                        text_queue = ui.label()
+                        btn_resume = ui.button("Resume Run", on_click=lambda: resume_run())
+                        if not controller.journal.active():
+                            btn_resume.disable()
+                        queue_updater = ui.timer(
+                            interval=5, callback=lambda: update_queue(), active=False
+                        )
                     with v_splitter.after:
                         ui.label("File Config")
                         temp_file_name_input = ui.input(
@@ -297,6 +544,28 @@ with ui.splitter() as splitter:
                             backward=lambda x: "data/" + x + ".csv",
                         )
                         pres_file_name.set_visibility(False)
+                        blank_well = ui.input(label="Blank Well", value="8H")
+                        # 0 writes a row per frame, up to one row every 10 s
+                        capture_interval = ui.number(
+                            label="Row Interval (s)", min=0, max=10, step=0.1, value=1
+                        )
+                        capture_mode = ui.select(
+                            ["mean", "median", "reject", "frame"], label="Row Averaging", value="mean"
+                        )
+                        ui.label("Live Analysis")
+                        analysis_table = ui.table(
+                            columns=[
+                                {"name": "well", "label": "Well", "field": "well"},
+                                {"name": "peaks", "label": "Peaks", "field": "peaks"},
+                                {"name": "last", "label": "Last Integral", "field": "last"},
+                                {"name": "running", "label": "Running", "field": "running"},
+                            ],
+                            rows=[],
+                            row_key="well",
+                        ).props("dense virtual-scroll").style("max-height: 300px")
+                        analysis_updater = ui.timer(
+                            interval=5, callback=lambda: update_analysis(), active=False
+                        )
     with splitter.after:
         ui.label("Camera Controls")
         with ui.row():
@@ -307,6 +576,13 @@ with ui.splitter() as splitter:
             btn_corners.disable()
             btn_wells = ui.button("Edit Wells", on_click=lambda: state.set_state(2))
             btn_wells.disable()
+            btn_detect = ui.button("Detect Wells", on_click=lambda: detect_wells())
+            btn_detect.disable()
+            btn_roi = ui.button("Crop to Plate", on_click=lambda: crop_to_plate())
+            btn_roi.disable()
+            binning = ui.select([1, 2, 4], value=1, label="Binning")
+            btn_full = ui.button("Full Frame", on_click=lambda: controller.clear_roi())
+            btn_full.disable()
             btn_probe = ui.button("Probe", on_click=lambda: state.set_state(0))
             btn_probe.disable()
             btn_start_data = ui.button(
@@ -333,27 +609,42 @@ with ui.splitter() as splitter:
                 .on("update:model-value", throttle=1.0)
             )
         video_image = ui.interactive_image(cross="green", on_mouse=mouse_handler)
+        # the wells are drawn on their own layer so the frame updates don't resend them
+        overlay = video_image.add_layer()
+        overlay_key = None
+        with ui.row().classes("w-full border p-4"):
+            emissivity = ui.number(label="Emissivity", min=0.01, max=1, step=0.01, value=None)
+            distance = ui.number(label="Object Distance", min=0, step=0.1, value=None)
+            reflected_temperature = ui.number(label="Reflected Temperature", step=0.1, value=None)
+            focus_position = ui.number(label="Focus Position", step=1, value=None)
+            ui.button("Apply", on_click=lambda: apply_camera_settings())
         with ui.row().classes("w-full border p-4"):
+            text_frames = ui.label()
+            ui.timer(1, update_frame_counters)
+        with ui.row().classes("w-full border p-4"):
+            layout_name = ui.input(label="Layout", value="plate")
+            ui.button("Save Layout", on_click=lambda: save_layout(layout_name.value))
+            ui.button("Load Layout", on_click=lambda: load_layout(layout_name.value))
+        with ui.row().classes("w-full border p-4"):
+            ui.label("Plate")
+            plate_format = ui.select(
+                ["24", "48", "96", "384", "custom"],
+                value="96",
+                on_change=lambda e: set_plate_format(e.value),
+            )
             ui.label("Number of X Wells")
             slider_x_wells = (
-                ui.slider(min=4, max=12, step=1, value=12,on_change=lambda: controller.set_well_count(x=slider_x_wells.value))
+                ui.slider(min=2, max=48, step=1, value=12,on_change=lambda: set_well_count(x=slider_x_wells.value))
                 .props("label-always")
                 .on("update:model-value", throttle=1.0)
             )
             ui.label("Number of Y Wells")
             slider_y_wells = (
-                ui.slider(min=4, max=8, step=1, value=8,on_change=lambda: controller.set_well_count(y=slider_y_wells.value))
+                ui.slider(min=2, max=32, step=1, value=8,on_change=lambda: set_well_count(y=slider_y_wells.value))
                 .props("label-always")
                 .on("update:model-value", throttle=1.0)
             )
         ui.timer(interval=0.1, callback=lambda: update_image())
-        writer = ui.timer(
-            interval=1,
-            callback=lambda: controller.write(
-                temp_file_name.text, datetime.now().time()
-            ),
-            active=False,
-        )
         auto_stop_timer = ui.timer(
             interval=500, callback=lambda: check_done(), active=False
         )